@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+""" Transcribes every page image and PDF score in a directory across a pool
+    of processes.
+
+    Each page image or score is written to its own .sm file. A page that
+    fails is recorded with its error and the rest of the run carries on.
+
+    Usage: batch_transcribe.py <directory> [output directory] [--processes N]
+"""
+
+import collections
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import pools
+import run
+
+PAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".pdf")
+
+def page_files(directory):
+    """ Returns the page images and PDFs in directory, sorted by name. """
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if os.path.splitext(name)[1].lower() in PAGE_EXTENSIONS)
+
+
+def transcribe_directory(directory, output_dir=None, processes=None,
+                         queue_size=None, classifiers=None, verbose=True):
+    """ Transcribes each page image or PDF in directory to a .sm file of the
+        same name in output_dir (directory by default). Files that only
+        differ by extension, like a.jpg and a.pdf, are written to a-jpg.sm
+        and a-pdf.sm.
+
+        Pages are spread over a pool of processes (all cores by default,
+        processes=1 works in this process). The classifiers, loaded with
+        run.load_classifiers when they are not given, are handed to each
+        worker once when it starts. At most queue_size pages, twice the
+        number of workers by default, are queued at once.
+
+        Returns a dict with the number of pages, the pages written, the
+        failures as a list of (page, error) pairs, the total seconds, the
+        pages written per second, and the seconds each stage of run.transcribe
+        took summed over the pages.
+    """
+    if output_dir is None:
+        output_dir = directory
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    if classifiers is None:
+        classifiers = run.load_classifiers("learn/learn.json")
+
+    started = time.time()
+    pages = page_files(directory)
+    jobs = list(zip(pages, _output_files(pages, output_dir)))
+
+    results = []
+    if processes == 1 or len(jobs) < 2:
+        pools.share(classifiers=classifiers)
+        for job in jobs:
+            results.append(_report(_transcribe_page(job), verbose))
+    else:
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if queue_size is None:
+            queue_size = 2 * processes
+        pool = pools.start_pool(processes, classifiers=classifiers)
+        try:
+            for result in pools.bounded_map(pool, _transcribe_page, jobs,
+                                            queue_size):
+                results.append(_report(result, verbose))
+        finally:
+            pool.close()
+            pool.join()
+
+    seconds = time.time() - started
+    timings = dict((stage, 0.0) for stage in run.TRANSCRIBE_STAGES)
+    for (_, _, page_timings, _) in results:
+        for (stage, spent) in page_timings.items():
+            timings[stage] += spent
+
+    written = [ output for (_, output, _, error) in results if error is None ]
+    summary = {
+        "pages": len(jobs),
+        "written": written,
+        "failures": [ (page, error) for (page, _, _, error) in results \
+                      if error is not None ],
+        "seconds": seconds,
+        "pages_per_second": len(written) / seconds if seconds > 0 else 0.0,
+        "timings": timings,
+    }
+    if verbose:
+        print_summary(summary)
+    return summary
+
+
+def print_summary(summary):
+    """ Prints the throughput of a run and the pages that failed. """
+    print("Transcribed %i of %i pages in %.2fs (%.2f pages/sec)" %
+          (len(summary["written"]), summary["pages"], summary["seconds"],
+           summary["pages_per_second"]))
+    for stage in run.TRANSCRIBE_STAGES:
+        print("%-9s %.4fs" % (stage, summary["timings"][stage]))
+    for (page, error) in summary["failures"]:
+        print("FAILED %s: %s" % (page, error.strip().splitlines()[-1]))
+
+
+def _output_files(pages, output_dir):
+    """ Names the .sm file each page is written to, adding the extension to
+        the name of pages that share their name with another page.
+    """
+    names = [ os.path.splitext(os.path.basename(page)) for page in pages ]
+    counts = collections.Counter(name for (name, _) in names)
+    return [ os.path.join(output_dir, (name if counts[name] == 1 else \
+                                       name + "-" + extension[1:].lower()) + ".sm") \
+             for (name, extension) in names ]
+
+
+def _transcribe_page(job):
+    """ Transcribes one page. Returns (page, output, timings, error) where
+        error is the formatted traceback if the page failed and None if it
+        was written.
+    """
+    (page, output) = job
+    title = os.path.splitext(os.path.basename(page))[0]
+    try:
+        (_, timings) = run.transcribe([page], output,
+                                       pools.shared("classifiers"), title)
+    except Exception: # pylint: disable=W0703
+        return (page, output, {}, traceback.format_exc())
+    return (page, output, timings, None)
+
+
+def _report(result, verbose):
+    """ Prints the outcome of a page as it finishes and passes it on. """
+    if verbose:
+        (page, output, _, error) = result
+        if error is None:
+            print("%s -> %s" % (page, output))
+        else:
+            print("%s failed" % page)
+    return result
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) > 1, \
+        "Usage: <directory> [output directory] [--processes N]"
+    args = sys.argv[1:]
+    num_processes = None
+    if "--processes" in args:
+        flag = args.index("--processes")
+        num_processes = int(args[flag + 1])
+        del args[flag:flag + 2]
+    transcribe_directory(args[0], args[1] if len(args) > 1 else None,
+                         num_processes)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+""" Benchmarks the algorithms in clustering on synthetic gaussian mixtures.
+
+    Each of n, d and m is swept in turn while the other two stay at their
+    base values, and every case records the wall time, the peak memory and
+    the number of iterations (for the iterative algorithms) of kmeans, em,
+    training gda, classifying with the gda model, and the dunn index.
+
+    Usage: benchmark_clustering.py run <output.json> [--quick]
+           benchmark_clustering.py compare <baseline.json> <current.json>
+"""
+
+# pylint: disable=C0103
+
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import clustering
+import instrumentation
+
+BASE = {"n": 10000, "d": 8, "m": 5}
+SWEEPS = {
+    "n": (1000, 10000, 100000),
+    "d": (2, 8, 32, 64),
+    "m": (2, 5, 10, 20),
+}
+QUICK_SWEEPS = {
+    "n": (1000, 5000),
+    "d": (2, 8),
+    "m": (2, 5),
+}
+
+EM_ITERATIONS = 100
+EM_TOLERANCE = 1e-3
+
+def mixture(n, d, m, seed=None):
+    """ Draws n points from a mixture of m random d dimensional gaussians
+        with equal weights.
+
+        Returns (data, labels) with a single data point in each column.
+    """
+    seeded = numpy.random.RandomState(seed)
+    labels = seeded.randint(m, size=n)
+    means = seeded.uniform(-10, 10, size=(d, m))
+    # a random linear map of unit normals gives each component its own
+    # covariance
+    scales = seeded.uniform(-1, 1, size=(m, d, d)) + numpy.eye(d)
+    normals = seeded.standard_normal((d, n))
+    data = numpy.einsum('nij,jn->in', scales[labels], normals) + means[:, labels]
+    return data, labels
+
+
+def cases(sweeps=None):
+    """ Returns the (n, d, m) of every case in the sweeps, without
+        repeating the base case.
+    """
+    if sweeps is None:
+        sweeps = SWEEPS
+    found = []
+    for name in ("n", "d", "m"):
+        for value in sweeps[name]:
+            case = dict(BASE)
+            case[name] = value
+            case = (case["n"], case["d"], case["m"])
+            if case not in found:
+                found.append(case)
+    return found
+
+
+def measure(run):
+    """ Calls run, which returns the number of iterations it took or None.
+
+        Returns a dict with the seconds the call took, the peak memory it
+        allocated in bytes and the iterations. The call is timed with
+        memory tracing off, since tracing every allocation slows it down,
+        and run is called a second time to find its peak memory.
+    """
+    started = time.time()
+    iterations = run()
+    seconds = time.time() - started
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    else:
+        before = instrumentation.memory_in_use()
+        run()
+        peak = max(instrumentation.memory_in_use() - before, 0)
+
+    return {"seconds": seconds, "peak_memory": peak, "iterations": iterations}
+
+
+def benchmark_case(n, d, m, seed=0):
+    """ Runs every algorithm on one mixture. Returns a list of results. """
+    (data, labels) = mixture(n, d, m, seed)
+    rows = numpy.ascontiguousarray(data.T)
+    steps = []
+
+    def run_kmeans():
+        del steps[:]
+        clustering.kmeans_labels(rows, m, seed=seed, callback=steps.append)
+        return sum(1 for step in steps if step["step"] == 'update')
+
+    def run_em():
+        # em picks its initial means with the random module
+        del steps[:]
+        random.seed(seed)
+        clustering.em(data, m, EM_ITERATIONS, EM_TOLERANCE, reg=1e-6,
+                      callback=steps.append)
+        return sum(1 for step in steps if step["step"] == 'M')
+
+    def run_gda_train():
+        clustering.gda(data, labels, m, reg=1e-6)
+
+    model = clustering.gda(data, labels, m, reg=1e-6)
+
+    def run_gda_classify():
+        model.predict(data)
+
+    def run_dunn_index():
+        clustering.dunn_index(data, labels, model.mu)
+
+    results = []
+    for (algorithm, run) in (("kmeans", run_kmeans), ("em", run_em),
+                             ("gda_train", run_gda_train),
+                             ("gda_classify", run_gda_classify),
+                             ("dunn_index", run_dunn_index)):
+        result = measure(run)
+        result.update({"algorithm": algorithm, "n": n, "d": d, "m": m})
+        results.append(result)
+        print("%-12s n=%-6i d=%-3i m=%-3i %9.4fs %10.1f MB %s" % (
+            algorithm, n, d, m, result["seconds"],
+            result["peak_memory"] / 1e6,
+            "" if result["iterations"] is None else
+            "%i iterations" % result["iterations"]))
+    return results
+
+
+def run_suite(sweeps=None, seed=0):
+    """ Benchmarks every case in the sweeps. Returns the run as a dict with
+        the environment it ran in and a list of results.
+    """
+    results = []
+    for (n, d, m) in cases(sweeps):
+        results.extend(benchmark_case(n, d, m, seed))
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "base": BASE,
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """ Matches the results of two runs by algorithm and case.
+
+        Returns a list of (key, baseline result, current result) for every
+        case in both runs, where key is (algorithm, n, d, m).
+    """
+    def keyed(run):
+        return dict(((result["algorithm"], result["n"], result["d"],
+                      result["m"]), result) for result in run["results"])
+
+    old = keyed(baseline)
+    new = keyed(current)
+    return [ (key, old[key], new[key]) for key in sorted(old) if key in new ]
+
+
+def print_comparison(matched):
+    """ Prints the time and memory of each matched case, with the ratio of
+        the current run to the baseline.
+    """
+    print("%-12s %6s %3s %3s %10s %10s %7s %9s %9s" % (
+        "algorithm", "n", "d", "m", "old s", "new s", "speedup",
+        "old MB", "new MB"))
+    for ((algorithm, n, d, m), old, new) in matched:
+        speedup = old["seconds"] / max(new["seconds"], 1e-9)
+        print("%-12s %6i %3i %3i %10.4f %10.4f %6.2fx %9.1f %9.1f" % (
+            algorithm, n, d, m, old["seconds"], new["seconds"], speedup,
+            old["peak_memory"] / 1e6, new["peak_memory"] / 1e6))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "run":
+        run = run_suite(QUICK_SWEEPS if "--quick" in sys.argv[3:] else SWEEPS)
+        with open(sys.argv[2], 'w') as output:
+            json.dump(run, output, indent=2, sort_keys=True)
+    elif len(sys.argv) > 3 and sys.argv[1] == "compare":
+        print_comparison(compare(json.load(open(sys.argv[2], 'r')),
+                                 json.load(open(sys.argv[3], 'r'))))
+    else:
+        print(__doc__)
@@ -4,44 +4,21 @@
 
 import numpy
 import math
+import itertools
+import multiprocessing
 import random as rand
+import time
+from scipy import linalg
 
-def dunn_index(data, labels, mu):
-    """ Computes the Dunn index for the given set of clusters. """
-    n = len(labels)
-    m = mu.shape[1]
-    data = numpy.asarray(data)
-
-    # group data in to classes
-    classes = []
-    for i in range(m):
-        classes.append([ data[:, j] for j in range(n) if labels[j] == i ])
+import instrumentation
+import pools
+import validity
 
-    # find min distance between any two means
-    min_dist = float("inf")
-    for i in range(m):
-        for j in range(m):
-            if i >= j:
-                continue
-            diff = numpy.asmatrix(mu[:, i] - mu[:, j])
-            dist = math.sqrt(diff * diff.T)
-            if dist < min_dist:
-                min_dist = dist
-
-    # find max distance between any two data points in the same cluster
-    max_dist = 0.0
-    for i in range(m):
-        points = len(classes[i])
-        for a in range(points):
-            for b in range(points):
-                if a >= b:
-                    continue
-                diff = numpy.asmatrix(classes[i][a] - classes[i][b])
-                dist = math.sqrt(diff * diff.T)
-                if dist > max_dist:
-                    max_dist = dist
-
-    return min_dist / max_dist
+def dunn_index(data, labels, mu):
+    """ Computes the Dunn index for the given set of clusters. See
+        validity.dunn_index.
+    """
+    return validity.dunn_index(data, labels, mu)
 
 
 def mean(arr):
@@ -70,91 +47,390 @@ def min_index(arr):
 
     return index
 
-def kmeans(data, num_clusters):
+def kmeans(data, num_clusters, tolerance=0.0, iteration_cap=300,
+           init='k-means++', n_init=1, seed=None, processes=None,
+           callback=None):
     """ This method will take in a set of data dn the number of clusters
         that the algorithm wants to find (m). This will then return the
         data witha cluster label.
 
-        The input data should be a 2D array as defined by numpy.zeros. """
-    # If the data structure that is recieved is numpy.matrix,
-	# this will convert it to numpy.array.
-    if(type(data) == numpy.matrix):
-        data = numpy.asarray(data)
+        The input data should be a 2D array as defined by numpy.zeros.
+        Iteration stops once no mean moves by more than tolerance in any
+        dimension, or after iteration_cap passes.
 
-    # How many data points there are
-    length = len(data)
-    # The dimension of the data point
-    dim = len(data[0])
-    # The label that is assigned to.
-    labels = numpy.zeros( (length, 1) )
+        See kmeans_labels for the init, n_init, seed, processes and callback
+        options.
 
-    cur_means = numpy.zeros( (num_clusters, dim) )
+        Returns (means, final_data) where final_data is the input data with
+        the label of each point appended as an extra column. Use
+        kmeans_labels to get the labels as an int array without the copy.
+    """
+    data = _as_rows(data)
+    (cur_means, labels) = kmeans_labels(data, num_clusters, tolerance,
+                                        iteration_cap, init, n_init, seed,
+                                        processes, callback)
 
-    #randomize means by choosing 3 points from the data at random.
-    for i in range(num_clusters):
-        index = math.floor(length * rand.random())
-        cur_means[i, :] = data[index, :]
+    # Combine the labels and the data together and return
+    # it with each cluster mean.
+    length, dim = data.shape
+    final_data = numpy.zeros( (length, dim + 1) )
 
-    converged = False
+    final_data[:, 0:dim] = data
+    final_data[:, dim] = labels
 
-    while not converged:
-        # Relabel each data point by its closest mean.
-        labels = relabel_data(data, num_clusters, cur_means)
+    return (cur_means, final_data)
 
-        prev_means = numpy.copy(cur_means)
+def kmeans_labels(data, num_clusters, tolerance=0.0, iteration_cap=300,
+                  init='k-means++', n_init=1, seed=None, processes=None,
+                  callback=None):
+    """ Runs k-means on data with a single data point in each row.
+
+        init picks the starting means and is one of 'random' (distinct rows
+        of the data), 'k-means++' or 'k-means||'. The algorithm is restarted
+        n_init times and the run with the lowest inertia is kept. When
+        n_init is more than one the restarts are spread over a pool of
+        processes (up to one per restart, and all cores by default;
+        processes=1 runs them in this process). Every restart gets its own seed drawn from seed, so the
+        result is reproducible for a given seed.
+
+        callback is called with a record of every assign and update step, as
+        described in instrumentation, with the inertia after each assign
+        step, the largest move of any mean after each update step, and the
+        restart the step belongs to. Records from restarts run in the pool
+        are passed on once the pool finishes.
+
+        Returns (means, labels) where means is a (num_clusters x dim) array
+        and labels is an int array holding the cluster of each row.
+    """
+    data = _as_rows(data)
+    if init not in _INITIALIZERS:
+        raise ValueError("unknown init %r, expected one of %s" %
+                         (init, sorted(_INITIALIZERS)))
+    if num_clusters > len(data):
+        raise ValueError("cannot find %i clusters in %i points" %
+                         (num_clusters, len(data)))
+
+    seeds = numpy.random.RandomState(seed).randint(2**31 - 1, size=n_init)
+    jobs = [ (num_clusters, tolerance, iteration_cap, init, s) for s in seeds ]
+
+    if n_init > 1 and processes != 1:
+        keep_records = callback is not None
+        processes = min(n_init, processes or multiprocessing.cpu_count())
+        pool = pools.start_pool(processes, restart_data=data)
+        try:
+            finished = pool.map(_kmeans_restart,
+                                [ job + (keep_records,) for job in jobs ])
+        finally:
+            pool.close()
+            pool.join()
+
+        results = []
+        for (restart, (result, records)) in enumerate(finished):
+            for record in records:
+                record["restart"] = restart
+                callback(record)
+            results.append(result)
+    else:
+        results = [ _run_restart(data, *job,
+                                 callback=_restart_reporter(callback, restart))
+                    for (restart, job) in enumerate(jobs) ]
+
+    (cur_means, labels, _, _) = min(results, key=lambda result: result[2])
+    return (cur_means, labels)
+
+def _run_restart(data, num_clusters, tolerance, iteration_cap, init, seed,
+                 callback=None):
+    """ Runs a single seeded k-means restart.
+
+        Returns (means, labels, inertia, iterations).
+    """
+    seeded = numpy.random.RandomState(seed)
+    cur_means = _INITIALIZERS[init](data, num_clusters, seeded)
+    return _lloyd(data, cur_means, tolerance, iteration_cap, callback)
+
+def _restart_reporter(callback, restart):
+    """ Wraps callback to tag each record with the restart it came from. """
+    if callback is None:
+        return None
+    def tagged(record):
+        """ Passes the tagged record on to callback. """
+        record["restart"] = restart
+        callback(record)
+    return tagged
+
+def _kmeans_restart(job):
+    """ Runs a restart in a pool worker.
+
+        Returns (result, records), with the records of every step when the
+        last item of the job asks for them.
+    """
+    records = []
+    callback = records.append if job[-1] else None
+    return (_run_restart(pools.shared("restart_data"), *job[:-1],
+                         callback=callback), records)
+
+def _random_init(data, num_clusters, seeded):
+    """ Picks distinct rows of the data as the initial means. """
+    picks = seeded.permutation(len(data))[:num_clusters]
+    return data[picks].copy()
+
+def _kmeans_plusplus(data, num_clusters, seeded, weights=None):
+    """ k-means++ seeding: each new mean is a row drawn with probability
+        proportional to its (weighted) squared distance to the closest mean
+        picked so far.
+    """
+    if weights is None:
+        weights = numpy.ones(len(data))
+
+    picks = [ _weighted_pick(weights, seeded) ]
+    (_, closest) = _nearest_means(data, data[picks])
+    for _ in range(1, num_clusters):
+        pick = _weighted_pick(weights * closest, seeded)
+        picks.append(pick)
+        (_, dist) = _nearest_means(data, data[pick:pick + 1])
+        closest = numpy.minimum(closest, dist)
+
+    return data[picks].copy()
+
+def _kmeans_parallel(data, num_clusters, seeded, rounds=5):
+    """ k-means|| seeding: oversamples candidate means in a few rounds over
+        the data, then reduces the candidates to num_clusters means with
+        k-means++ weighted by how many points each candidate is closest to.
+    """
+    oversampling = 2 * num_clusters
+    candidates = data[[ seeded.randint(len(data)) ]]
+    (_, closest) = _nearest_means(data, candidates)
+
+    for _ in range(rounds):
+        cost = closest.sum()
+        if cost <= 0:
+            break
+        chosen = seeded.random_sample(len(data)) < oversampling*closest / cost
+        if not chosen.any():
+            continue
+        candidates = numpy.vstack((candidates, data[chosen]))
+        (_, dist) = _nearest_means(data, data[chosen])
+        closest = numpy.minimum(closest, dist)
+
+    if len(candidates) < num_clusters:
+        return _kmeans_plusplus(data, num_clusters, seeded)
+
+    (labels, _) = _nearest_means(data, candidates)
+    weights = numpy.bincount(labels, minlength=len(candidates))
+    return _kmeans_plusplus(candidates, num_clusters, seeded,
+                            weights.astype(numpy.float64))
+
+def _weighted_pick(weights, seeded):
+    """ Returns an index drawn with probability proportional to weights,
+        or uniformly when all of the weights are zero.
+    """
+    cumulative = numpy.cumsum(weights)
+    total = cumulative[-1]
+    if total <= 0:
+        return seeded.randint(len(weights))
+    index = numpy.searchsorted(cumulative, seeded.random_sample() * total,
+                               side='right')
+    return min(index, len(weights) - 1)
+
+_INITIALIZERS = {
+    'random': _random_init,
+    'k-means++': _kmeans_plusplus,
+    'k-means||': _kmeans_parallel,
+}
+
+def _as_rows(data):
+    """ Converts data with a single data point in each row (including
+        numpy.matrix) to a 2D float array.
+    """
+    return numpy.asarray(data, dtype=numpy.float64)
+
+def _lloyd(data, means, tolerance, iteration_cap, callback=None):
+    """ Runs Lloyd iterations from the given initial means.
+
+        Returns (means, labels, inertia, iterations), where inertia is the
+        sum of squared distances from each point to its mean.
+    """
+    means = numpy.array(means, dtype=numpy.float64)
+    iterations = 0
+    for iterations in range(1, iteration_cap + 1):
+        # Relabel each data point by its closest mean.
+        started = time.time()
+        (labels, dist) = _nearest_means(data, means)
+        if callback is not None:
+            instrumentation.report(callback, 'kmeans', iterations - 1,
+                                   'assign', started,
+                                   inertia=float(dist.sum()))
 
         # Re-evaluate each mean by taking the mean of the cluster.
-        cur_means = reevaluate_means(data, num_clusters, labels)
+        started = time.time()
+        new_means = _cluster_means(data, labels, means, dist)
+
+        # This will check for convergence by seeing how far the means moved
+        shift = numpy.abs(new_means - means).max()
+        means = new_means
+        instrumentation.report(callback, 'kmeans', iterations - 1, 'update',
+                               started, delta=float(shift))
+        if shift <= tolerance:
+            break
 
-        # This will check for convergence by seeing if the difference
-        # between the previous means and the current means have changed.
-        result = cur_means == prev_means
-        converged = result.all()
+    (labels, dist) = _nearest_means(data, means)
+    return (means, labels, float(dist.sum()), iterations)
 
-    # Combine the labels and the data together and return
-    # it with each cluster mean.
-    final_data = numpy.zeros( (length, dim + 1) )
+def _nearest_means(data, means):
+    """ Finds the closest mean to each row of data.
+
+        Returns (labels, dist) where dist is the squared distance from each
+        point to its mean.
+    """
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, for every pair at once
+    dist = numpy.dot(data, means.T)
+    dist *= -2.0
+    dist += (means * means).sum(axis=1)
+    dist += (data * data).sum(axis=1)[:, numpy.newaxis]
+
+    labels = dist.argmin(axis=1).astype(numpy.int32)
+    nearest = dist[numpy.arange(len(data)), labels]
+    return (labels, numpy.maximum(nearest, 0.0))
+
+def _cluster_means(data, labels, means, dist):
+    """ Recomputes each mean from the points labeled with it using sorted
+        segment sums.
+
+        A cluster that lost all of its points is moved to the point that is
+        currently farthest from its own mean, so no mean is left behind.
+    """
+    (sums, counts) = _cluster_sums(data, labels, len(means))
 
-    final_data[:, 0:dim] = data[:, :]
-    final_data[:, dim] = labels[:, 0]
+    new_means = numpy.empty_like(means)
+    full = counts > 0
+    new_means[full] = sums[full] / counts[full, numpy.newaxis]
 
-    return (cur_means, final_data)
+    empty = numpy.flatnonzero(~full)
+    if len(empty) > 0:
+        farthest = numpy.argsort(dist)[::-1][:len(empty)]
+        new_means[empty[:len(farthest)]] = data[farthest]
+    return new_means
+
+def _cluster_sums(data, labels, num_clusters):
+    """ Returns (sums, counts), the per cluster sum of the rows of data and
+        the number of rows in each cluster.
+    """
+    counts = numpy.bincount(labels, minlength=num_clusters)
+    sums = numpy.zeros((num_clusters, data.shape[1]))
+
+    order = numpy.argsort(labels, kind='mergesort')
+    present = numpy.flatnonzero(counts)
+    if len(present) > 0:
+        starts = numpy.concatenate(([0], numpy.cumsum(counts[present])[:-1]))
+        sums[present] = numpy.add.reduceat(data[order], starts, axis=0)
+    return (sums, counts)
 
 def relabel_data(data, num_clusters, cur_means):
     """ Go through each data point and relabel it based on
         its closest mean. """
-    labels = numpy.zeros( (len(data), 1) )
-    for i in range(len(data)):
-        # Go through each cluster
-        distance = numpy.zeros( (num_clusters, 1) )
-        for j in range(num_clusters):
-            for k in range(0, len(data[0])):
-                distance[j, 0] += (data[i, k] - cur_means[j, k])**2
-            distance[j, 0] = math.sqrt(distance[j, 0])
-        index = min_index(distance)
-        labels[i] = index
-
-    return labels
+    (labels, _) = _nearest_means(_as_rows(data),
+                                 _as_rows(cur_means)[:num_clusters])
+    return labels[:, numpy.newaxis]
 
 def reevaluate_means(data, num_clusters, labels):
     """ This will recompute each mean based on the mean of the new cluster
-        of the data. """
-    means = numpy.zeros( (num_clusters, len(data[0])) )
-    for j in range(num_clusters):
-        label_array = numpy.zeros( (0, len(data[0])) )
-        for i in range(len(data)):
-            if labels[i] == j:
-                label_array = numpy.vstack( (label_array, data[i, :]) )
-        means[j, :] = mean(label_array)[0, :]
-    return means
+        of the data. Clusters without any points get a mean of zero. """
+    labels = numpy.asarray(labels).astype(numpy.intp).ravel()
+    (sums, counts) = _cluster_sums(_as_rows(data), labels, num_clusters)
+    return sums / numpy.maximum(counts, 1)[:, numpy.newaxis]
+
+
+class MiniBatchKMeans(object):
+    """ Mini-batch k-means for data that does not fit in memory.
+
+        Rows are consumed in fixed size batches, and each mean moves toward
+        the points assigned to it with a learning rate of one over the number
+        of points it has seen so far. Only the means and the per cluster
+        counts are kept between batches.
+    """
+    def __init__(self, num_clusters, batch_size=1024, seed=None):
+        self.num_clusters = num_clusters
+        self.batch_size = batch_size
+        self.means = None
+        self.counts = numpy.zeros(num_clusters, dtype=numpy.int64)
+        self._rand = numpy.random.RandomState(seed)
+
+    def partial_fit(self, batch):
+        """ Updates the means using a single batch of rows. """
+        batch = _as_rows(batch)
+        if self.means is None:
+            self._init_means(batch)
+
+        (labels, _) = _nearest_means(batch, self.means)
+        (sums, counts) = _cluster_sums(batch, labels, self.num_clusters)
+        self.counts += counts
+
+        # stepping each mean by 1/count for every new point is the same as
+        # stepping it toward the batch mean by batch_count/count
+        full = counts > 0
+        rate = counts[full] / self.counts[full].astype(numpy.float64)
+        batch_means = sums[full] / counts[full, numpy.newaxis]
+        self.means[full] += rate[:, numpy.newaxis] * \
+            (batch_means - self.means[full])
+        return self
+
+    def fit(self, rows):
+        """ Makes a single pass over rows, which may be an array (including a
+            numpy.memmap) or any iterable of feature rows.
+        """
+        for batch in _iter_batches(rows, self.batch_size):
+            self.partial_fit(batch)
+        return self
+
+    def predict(self, batch):
+        """ Returns the label of each row in the batch as an int array. """
+        (labels, _) = _nearest_means(_as_rows(batch), self.means)
+        return labels
+
+    def iter_labels(self, rows):
+        """ Streams the labels for rows, one batch of labels at a time. """
+        for batch in _iter_batches(rows, self.batch_size):
+            yield self.predict(batch)
+
+    def _init_means(self, batch):
+        """ Seeds the means from the first batch with k-means++. """
+        if len(batch) < self.num_clusters:
+            raise ValueError("the first batch needs at least %i rows" %
+                             self.num_clusters)
+        self.means = _kmeans_plusplus(batch, self.num_clusters, self._rand)
+
+
+def _iter_batches(rows, batch_size):
+    """ Yields batches of at most batch_size rows from an array or from an
+        iterable of rows. Slicing an array (or a memmap) does not copy it.
+    """
+    if hasattr(rows, 'shape'):
+        for start in range(0, rows.shape[0], batch_size):
+            yield rows[start:start + batch_size]
+        return
+
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield numpy.vstack(batch)
 
 
 # This is just a self reminder to try and do arrays so that a single element
 # of data is contained in a column.  This means that the input data array
 # should be in R(a x n), and the array of means should be in R(a x m).
 
-def em(data, m, iteration_cap, tolerance):
-    """ Runs the em algorithm """
+def em(data, m, iteration_cap, tolerance, reg=0.0, callback=None):
+    """ Runs the em algorithm.
+
+        reg is a ridge added to the diagonal of each covariance on every
+        M-step, which keeps them invertible on high dimensional features.
+
+        callback is called with a record of every E and M step, as described
+        in instrumentation, with the log likelihood after each E step and
+        the largest change in any parameter after each M step.
+    """
     data = numpy.asarray(data) # convert data to an array
     n = data.shape[1]
     a = data.shape[0]
@@ -169,19 +445,22 @@ def em(data, m, iteration_cap, tolerance):
     sig = numpy.dstack([numpy.eye(a) for _ in range(0, m)])
 
     for i in range(0, iteration_cap):
-        w = _e_step(data, m, phi, mu, sig)
-        (new_phi, new_mu, new_sig) = _m_step(data, m, w)
+        started = time.time()
+        (w, log_likelihood) = _e_step(data, m, phi, mu, sig)
+        instrumentation.report(callback, 'em', i, 'E', started,
+                               log_likelihood=log_likelihood)
 
-        print(i)
+        started = time.time()
+        (new_phi, new_mu, new_sig) = _m_step(data, m, w, reg)
 
         diff = _get_max([(new_mu - mu), (new_sig - sig), (new_phi - phi)])
+        instrumentation.report(callback, 'em', i, 'M', started, delta=diff)
 
         phi = new_phi
         mu = new_mu
         sig = new_sig
 
         if diff < tolerance:
-            print("Converged: %i" % i)
             break
 
 
@@ -192,14 +471,7 @@ def _get_max(arrays):
     """ Gets the maximum absolute value out of the given array of arrays or
         matrices.
     """
-    maximum = 0
-    for i in range(0, len(arrays)):
-        vals = arrays[i].flatten()
-        for j in range(0, len(vals)):
-            if abs(vals[j]) > maximum:
-                maximum = abs(vals[j])
-
-    return maximum
+    return float(max(numpy.abs(array).max() for array in arrays))
 
 
 def _e_step(data, m, phi, mu, sig):
@@ -207,131 +479,284 @@ def _e_step(data, m, phi, mu, sig):
 
         The data should be a an array with n columns with a single data point in
         each column. Data points can be any dimension vector.
-    """
 
-    n = data.shape[1]
-    w = numpy.zeros((m, n))
+        Returns (w, log_likelihood) where log_likelihood is the log likelihood
+        of all of the data under the current parameters.
+    """
 
-    for i in range(0, n):
+    # find w in log space
+    # w_{ij} = \frac{ \mathcal{N}(\mu_j, \Sigma_j) \phi_j }
+    #          { \sum_{k=1}^m \mathcal{N}(\mu_k, \Sigma_k) \phi_k }
+    with numpy.errstate(divide='ignore'):
+        log_nums = _log_gauss(data, mu, sig) + numpy.log(phi)[:, numpy.newaxis]
 
-        # find w
-        # w_{ij} = \frac{ \mathcal{N}(\mu_j, \Sigma_j) \phi_j }
-        #          { \sum_{k=1}^m \mathcal{N}(\mu_k, \Sigma_k) \phi_k }
+    # log-sum-exp over the components, shifted by the largest term so the
+    # denominator can not underflow
+    top = log_nums.max(axis=0)
+    finite = numpy.isfinite(top)
+    top[~finite] = 0.0
+    log_denom = top + numpy.log(numpy.exp(log_nums - top).sum(axis=0))
 
-        nums = [_gauss(data[:, i], mu[:, k], sig[:, :, k])*phi[k] \
-                for k in range(0, m)]
-        denom = sum(nums)
+    w = numpy.exp(log_nums - log_denom)
 
-        # nomalize so the sum of all nums is 1
-        # zero case check
-        if denom is 0:
-            # probabilities should be equal
-            nums = numpy.ones((m)) / m
-        else:
-            nums = numpy.array(nums) / denom
+    # zero case check, a point no component can explain is shared equally
+    w[:, ~finite] = 1.0 / m
 
-        # for all j set w_{ij}
-        w[:, i] = nums
+    return (w, float(log_denom[finite].sum()))
 
-    return w
 
+def _log_gauss(data, mu, sig):
+    """ Finds the log probability of every column of data being drawn from
+        each of the normal distributions defined by the columns of mu and the
+        slices of sig. Returns an (m x n) array.
 
-def _m_step(data, m, w):
-    """ Does the maximization step of the em algoithm """
+        Each covariance is factored once with Cholesky, and the Mahalanobis
+        distances of all of the points come out of one triangular solve.
+    """
+    a = data.shape[0]
+    m = mu.shape[1]
+    log_dens = numpy.empty((m, data.shape[1]))
+    for k in range(m):
+        chol = numpy.linalg.cholesky(sig[:, :, k])
+        z = linalg.solve_triangular(chol, data - mu[:, k:k+1], lower=True,
+                                    check_finite=False)
+        log_det = 2.0 * numpy.log(numpy.diagonal(chol)).sum()
+        log_dens[k] = -0.5 * (a * math.log(2*math.pi) + log_det +
+                              (z * z).sum(axis=0))
+    return log_dens
+
+
+def _m_step(data, m, w, reg=0.0):
+    """ Does the maximization step of the em algoithm.
+
+        reg is added to the diagonal of every covariance to keep them
+        positive definite when a component collapses onto too few points.
+    """
     n = data.shape[1]
     a = data.shape[0]
 
-    phi = numpy.zeros(m)
-    mu = numpy.zeros((a, m))
-    sig = numpy.zeros((a, a, m))
-
-    for j in range(0, m):
-        # \phi_j = \frac{1}{n} \sum_{i=1}^n w_{ij}
-        # \mu_j = \frac{ \sum_{i=1}^n w_{ij} x_i } { \sum_{i=1}^n w_{ij} }
-        # \Sigma_j = \frac { \sum_{i=1}^n w_{ij} (x_i - \mu_j)(x_i - \mu_j)^T }
-        #            { \sum_{i=1}^n w_{ij} }
-
-        # find the sum of the wi's and mu_j
-        mu_j = numpy.zeros(a)
-        sum_wij = 0
-        for i in range(0, n):
-            sum_wij += w[j, i]
-            mu_j += w[j, i] * data[:, i]
-        mu_j = 1.0/sum_wij * mu_j
-
-        # find sig_j
-        sig_j = numpy.zeros((a, a))
-        for i in range(0, n):
-            diff = numpy.matrix([(data[:, i] - mu_j)])
-            sig_j += w[j, i] * diff.T*diff
-        sig_j = 1.0/sum_wij * sig_j
-
-        # store the results in the arrays to return
-        phi[j] = 1.0/n * sum_wij
-        mu[:, j] = mu_j
-        sig[:, :, j] = sig_j
+    # \phi_j = \frac{1}{n} \sum_{i=1}^n w_{ij}
+    # \mu_j = \frac{ \sum_{i=1}^n w_{ij} x_i } { \sum_{i=1}^n w_{ij} }
+    # \Sigma_j = \frac { \sum_{i=1}^n w_{ij} (x_i - \mu_j)(x_i - \mu_j)^T }
+    #            { \sum_{i=1}^n w_{ij} }
+    sum_w = w.sum(axis=1)
+    phi = sum_w / n
+    mu = numpy.dot(data, w.T) / sum_w
+
+    sig = numpy.empty((a, a, m))
+    for j in range(m):
+        diff = data - mu[:, j:j+1]
+        sig[:, :, j] = numpy.dot(diff * w[j], diff.T) / sum_w[j]
+
+    if reg:
+        diagonal = numpy.arange(a)
+        sig[diagonal, diagonal, :] += reg
 
     return (phi, mu, sig)
 
 
-def _gauss(x, mu, sig):
-    """ Finds the probability of the point x being drawn from the normal
-        distribution defined by mu and sig.
-    """
-    a = x.shape[0]
-    diff = numpy.asmatrix(x - mu)
-    return 1.0/math.sqrt((2*math.pi)**a * numpy.linalg.det(sig)) * \
-        math.exp(-0.5 * (diff * numpy.linalg.inv(sig) * diff.T)[0,0])
+class OnlineEM(object):
+    """ Online em for a mixture of m gaussians.
 
+        Instead of passing over all of the data on every iteration, each call
+        to partial_fit takes a batch of columns, runs the E-step on it, and
+        moves running averages of the sufficient statistics toward the
+        batch's statistics by a decaying step size. The parameters are then
+        read back out of the running averages.
 
-def gda(data, labels, m):
+        The step size for the t-th batch is (t + step_offset)^-step_decay,
+        where step_decay should be in (0.5, 1] for the estimates to settle.
+    """
+    def __init__(self, m, step_offset=2.0, step_decay=0.6, reg=0.0,
+                 seed=None):
+        self.m = m
+        self.step_offset = step_offset
+        self.step_decay = step_decay
+        self.reg = reg
+        self.batches = 0
+        self.log_likelihood = None
+        self._rand = numpy.random.RandomState(seed)
+        self._params = None
+        self._stats = None
+
+    def step_size(self):
+        """ Returns the step size the next batch will be applied with. """
+        return (self.batches + self.step_offset) ** -self.step_decay
+
+    def get_params(self):
+        """ Returns copies of the current (phi, mu, sig). Raises ValueError
+            before the first partial_fit.
+        """
+        if self._params is None:
+            raise ValueError("no batches fitted yet, call partial_fit first")
+        return tuple(numpy.copy(param) for param in self._params)
+
+    def partial_fit(self, batch):
+        """ Updates the mixture from a batch with a single data point in each
+            column.
+        """
+        batch = numpy.asarray(batch, dtype=numpy.float64)
+        if self._params is None:
+            self._init_params(batch)
+
+        (phi, mu, sig) = self._params
+        (w, self.log_likelihood) = _e_step(batch, self.m, phi, mu, sig)
+
+        # the per point averages of w_{ij}, w_{ij} x_i and w_{ij} x_i x_i^T
+        n = batch.shape[1]
+        batch_stats = (w.sum(axis=1) / n,
+                       numpy.dot(batch, w.T) / n,
+                       numpy.dstack([ numpy.dot(batch * w[j], batch.T) / n \
+                                      for j in range(self.m) ]))
+
+        rate = self.step_size()
+        self._stats = tuple((1.0 - rate) * stat + rate * new_stat \
+                            for (stat, new_stat) in zip(self._stats,
+                                                        batch_stats))
+        self.batches += 1
+        self._params = self._params_from_stats()
+        return self
+
+    def _init_params(self, batch):
+        """ Starts with equal phi's, k-means++ means from the batch, and the
+            covariance of the batch around its closest means for every
+            component.
+        """
+        (a, n) = batch.shape
+        if n < self.m:
+            raise ValueError("the first batch needs at least %i columns" %
+                             self.m)
+        phi = numpy.ones(self.m) / self.m
+        mu = _kmeans_plusplus(batch.T, self.m, self._rand).T
+
+        (labels, _) = _nearest_means(batch.T, mu.T)
+        diff = batch - mu[:, labels]
+        cov = numpy.dot(diff, diff.T) / n
+        sig = numpy.dstack([ cov for _ in range(self.m) ])
+
+        # the statistics leave out reg, which _params_from_stats adds back
+        self._stats = (phi, mu * phi,
+                       (sig + numpy.einsum('kj,lj->klj', mu, mu)) * phi)
+        self._params = (phi, mu, sig + self.reg * numpy.eye(a)[:, :, None])
+
+    def _params_from_stats(self):
+        """ Returns (phi, mu, sig) for the current sufficient statistics. """
+        (s0, s1, s2) = self._stats
+        phi = s0 / s0.sum()
+        mu = s1 / s0
+        sig = s2 / s0 - numpy.einsum('kj,lj->klj', mu, mu)
+        if self.reg:
+            diagonal = numpy.arange(mu.shape[0])
+            sig[diagonal, diagonal, :] += self.reg
+        return (phi, mu, sig)
+
+
+def gda(data, labels, m, reg=0.0):
     """ Expects data as a numpy array with a single data point in a column.
         Expects labels to be in [0, m) as a list.
+
+        reg is added to the diagonal of each class covariance, for classes
+        with too few points to give an invertible one.
+
+        Returns a GDAModel holding the learned phi, mu and sig.
     """
-    data = numpy.asarray(data)
+    data = numpy.asarray(data, dtype=numpy.float64)
+    labels = numpy.asarray(labels, dtype=numpy.intp)
     a = data.shape[0]
     n = data.shape[1]
 
     # compute phi
-    phi = numpy.array([ 1.0/n * _occurrences(j, labels) for j in range(m) ])
+    counts = numpy.bincount(labels, minlength=m).astype(numpy.float64)
+    phi = counts / n
 
     # compute mu
-    mu = numpy.zeros((a, m))
-    for i in range(n):
-        j = labels[i]
-        mu[:, j] = mu[:, j] + data[:, i]
-    for j in range(m):
-        mu[:, j] = 1.0/_occurrences(j, labels) * mu[:, j]
-
-    # compute sigma
-    sig = numpy.zeros((a, a, m))
-    for i in range(n):
-        j = labels[i]
-        diff = numpy.asmatrix(data[:, i] - mu[:, j])
-        sig[:, :, j] = sig[:, :, j] + diff.T * diff
+    (sums, _) = _cluster_sums(data.T, labels, m)
+    mu = sums.T / numpy.maximum(counts, 1)
+
+    # compute sigma, a class with no points gets the identity (and since
+    # its phi is zero it is never predicted)
+    sig = numpy.empty((a, a, m))
+    diff = data - mu[:, labels]
     for j in range(m):
-        sig[:, :, j] = 1.0/_occurrences(j, labels) * sig[:, :, j]
+        if counts[j] == 0:
+            sig[:, :, j] = numpy.eye(a)
+            continue
+        in_class = diff[:, labels == j]
+        sig[:, :, j] = numpy.dot(in_class, in_class.T) / counts[j]
 
-    # return a function that classifies new data
-    def classify(x):
+    if reg:
+        diagonal = numpy.arange(a)
+        sig[diagonal, diagonal, :] += reg
+
+    return GDAModel(phi, mu, sig)
+
+
+class GDAModel(object):
+    """ A trained gaussian discriminant analysis classifier.
+
+        The precision matrix and log determinant of every class covariance
+        are computed once when the model is built (or passed in, when loading
+        a saved model), so scoring only needs a matrix product per class.
+    """
+    def __init__(self, phi, mu, sig, precision=None, log_det=None):
+        self.phi = phi
+        self.mu = mu
+        self.sig = sig
+        if precision is not None and log_det is not None:
+            self.precision = precision
+            self.log_det = log_det
+            return
+
+        a = mu.shape[0]
+        m = mu.shape[1]
+        self.precision = numpy.empty((a, a, m))
+        self.log_det = numpy.empty(m)
+        for j in range(m):
+            chol = numpy.linalg.cholesky(sig[:, :, j])
+            inv_chol = linalg.solve_triangular(chol, numpy.eye(a), lower=True)
+            self.precision[:, :, j] = numpy.dot(inv_chol.T, inv_chol)
+            self.log_det[j] = 2.0 * numpy.log(numpy.diagonal(chol)).sum()
+
+    def log_joint(self, data):
+        """ Returns the (m x n) array of log(p(x | y=j) p(y=j)) for every
+            column x of data.
+        """
+        data = numpy.asarray(data, dtype=numpy.float64)
+        a = data.shape[0]
+        m = self.mu.shape[1]
+
+        with numpy.errstate(divide='ignore'):
+            log_phi = numpy.log(self.phi)
+
+        scores = numpy.empty((m, data.shape[1]))
+        for j in range(m):
+            diff = data - self.mu[:, j:j+1]
+            dist = (diff * numpy.dot(self.precision[:, :, j], diff)).sum(axis=0)
+            scores[j] = log_phi[j] - 0.5 * (a * math.log(2*math.pi) +
+                                            self.log_det[j] + dist)
+        return scores
+
+    def predict_log_proba(self, data):
+        """ Returns the (m x n) array of log posteriors log p(y=j | x) for
+            every column x of data.
+        """
+        scores = self.log_joint(data)
+        top = scores.max(axis=0)
+        return scores - (top + numpy.log(numpy.exp(scores - top).sum(axis=0)))
+
+    def predict_proba(self, data):
+        """ Returns the (m x n) array of posteriors p(y=j | x) for every column
+            x of data.
+        """
+        return numpy.exp(self.predict_log_proba(data))
+
+    def predict(self, data):
+        """ Returns the most likely label of every column of data. """
+        return self.log_joint(data).argmax(axis=0)
+
+    def classify(self, x):
         """ Classifies the data point x using the learned parameters. """
-        label = 0
-        prob = _gauss(x, mu[:, 0], sig[:, :, 0]) * phi[0]
-        for j in range(1, m):
-            new_prob = _gauss(x, mu[:, j], sig[:, :, j]) * phi[j]
-            if new_prob > prob:
-                label = j
-                prob = new_prob
-        return label
-        
-    return classify, phi, mu, sig
-
-
-def _occurrences(item, items):
-    """ Returns the number of occurrences of item in the list of items. """
-    n = 0
-    for e in items:
-        if e is item:
-            n = n + 1
-
-    return n
+        x = numpy.asarray(x, dtype=numpy.float64).reshape((-1, 1))
+        return int(self.predict(x)[0])
+
+    __call__ = classify
@@ -0,0 +1,102 @@
+""" Contains a stratified k-fold cross validation harness for the classifiers.
+
+    As in clustering, features is an array with a single data point in each
+    column and labels holds the class of each column in [0, m).
+"""
+
+# pylint: disable=C0103
+
+import multiprocessing
+import time
+
+import numpy
+
+import clustering
+import pools
+
+def stratified_folds(labels, k, seed=None):
+    """ Splits the indices of labels into k folds, dealing the shuffled
+        members of every class out in turn so each fold gets about the same
+        share of each class.
+
+        Returns a list of k arrays of test indices.
+    """
+    labels = numpy.asarray(labels, dtype=numpy.intp)
+    order = shuffled_runs(labels, numpy.random.RandomState(seed))
+
+    # deal round robin, starting each class where the last one stopped
+    fold_of = numpy.empty(len(labels), dtype=numpy.intp)
+    fold_of[order] = numpy.arange(len(labels)) % k
+    return [ numpy.flatnonzero(fold_of == fold) for fold in range(k) ]
+
+
+def shuffled_runs(labels, seeded):
+    """ Returns an order of the indices of labels that puts each class in a
+        run, sorted by class, with the members of each class shuffled by the
+        numpy.random.RandomState seeded.
+    """
+    order = seeded.permutation(len(labels))
+    return order[numpy.argsort(labels[order], kind='mergesort')]
+
+
+def cross_validate(features, labels, m, k=5, seed=None, processes=None,
+                   reg=1e-6):
+    """ Trains and tests a GDA classifier on each of k stratified folds, in
+        a pool of processes (up to one per fold, and all cores by default;
+        processes=1 works in this process). reg is passed on to
+        clustering.gda.
+
+        Returns a dict with the overall accuracy, the accuracy and seconds
+        taken by each fold, and the (m x m) confusion matrix, where
+        confusion[i, j] counts the points of class i classified as j.
+    """
+    features = numpy.asarray(features, dtype=numpy.float64)
+    labels = numpy.asarray(labels, dtype=numpy.intp)
+    folds = stratified_folds(labels, k, seed)
+    jobs = [ (test, m, reg) for test in folds ]
+
+    if processes == 1:
+        pools.share(fold_data=(features, labels))
+        results = [ _run_fold(job) for job in jobs ]
+    else:
+        processes = min(k, processes or multiprocessing.cpu_count())
+        pool = pools.start_pool(processes, fold_data=(features, labels))
+        try:
+            results = pool.map(_run_fold, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    confusion = numpy.zeros((m, m), dtype=numpy.int64)
+    fold_accuracy = []
+    fold_seconds = []
+    for (test, (predicted, seconds)) in zip(folds, results):
+        expected = labels[test]
+        confusion += numpy.bincount(expected * m + predicted,
+                                    minlength=m * m).reshape((m, m))
+        fold_accuracy.append(float((predicted == expected).mean()) \
+                             if len(test) else float("nan"))
+        fold_seconds.append(seconds)
+
+    return {
+        "accuracy": float(numpy.trace(confusion)) / max(confusion.sum(), 1),
+        "fold_accuracy": fold_accuracy,
+        "fold_seconds": fold_seconds,
+        "confusion": confusion,
+    }
+
+
+def _run_fold(job):
+    """ Trains on everything but the test indices and classifies the test
+        indices. Returns (predicted labels, seconds taken).
+    """
+    (test, m, reg) = job
+    (features, labels) = pools.shared("fold_data")
+    started = time.time()
+
+    train = numpy.ones(len(labels), dtype=bool)
+    train[test] = False
+    model = clustering.gda(features[:, train], labels[train], m, reg)
+    predicted = model.predict(features[:, test])
+
+    return (predicted, time.time() - started)
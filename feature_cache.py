@@ -0,0 +1,235 @@
+""" An on-disk cache of the feature vectors extracted from image files.
+
+    Entries are keyed by the sha1 of the image file's contents, so a renamed
+    or copied image is still a hit and an edited one is a miss. Each feature
+    extractor gets its own directory named after its
+    fingerprints.extractor_identity, holding:
+
+        features.f64  -- the float64 vectors one after another, memory
+                         mapped as a (rows x features) matrix
+        index.json    -- the number of rows, the row and last use of each
+                         content hash
+
+    New vectors are appended to the end of the matrix, so saving them costs
+    only what was added. Editing an extractor changes its identity, so its
+    old directory is dropped the next time the cache is opened. Once there
+    are more than max_entries vectors the matrix is rewritten with only the
+    most recently used ones.
+"""
+
+import collections
+import json
+import os
+import re
+import shutil
+
+import numpy
+from scipy import misc
+
+import fingerprints
+import pipeline
+
+# a full cache is compacted down to this share of max_entries, so the next
+# flushes can append again instead of each rewriting the matrix
+COMPACT_FRACTION = 0.9
+
+class FeatureCache(object):
+    """ Caches the output of get_features for image files. """
+    def __init__(self, get_features, directory="cache/features",
+                 max_entries=100000, load_image=None):
+        self.get_features = get_features
+        self.max_entries = max_entries
+        self.load_image = load_image if load_image is not None else misc.imread
+
+        identity = fingerprints.extractor_identity(get_features)
+        (name, code_hash) = identity.rsplit(":", 1)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+        self.directory = os.path.join(directory, "%s-%s" % (name, code_hash))
+        _drop_stale(directory, name, self.directory)
+
+        self._matrix_file = os.path.join(self.directory, "features.f64")
+        self._index_file = os.path.join(self.directory, "index.json")
+        self._load()
+
+    def features(self, file_names, processes=1):
+        """ Returns the (n x features) matrix of the features of the given
+            image files, and saves the cache. Only the images that are not
+            cached are decoded, spread over processes workers (see
+            pipeline.featurize). With no files it is an empty (0 x 0) matrix.
+        """
+        if not file_names:
+            return numpy.empty((0, 0))
+        keys = [ fingerprints.file_hash(file_name) for file_name in file_names ]
+
+        missing = collections.OrderedDict()
+        for (key, file_name) in zip(keys, file_names):
+            if key not in self._index and key not in self._pending:
+                missing.setdefault(key, file_name)
+        if missing:
+            vectors = pipeline.featurize(missing.values(), self.get_features,
+                                         processes, load_image=self.load_image)
+            for (key, vector) in zip(missing, vectors):
+                self._store(key, vector)
+
+        rows = [ self._lookup(key) for key in keys ]
+        self.flush()
+        return numpy.vstack(rows)
+
+    def get(self, file_name):
+        """ Returns the feature vector of the image file. """
+        key = fingerprints.file_hash(file_name)
+        if key not in self._index and key not in self._pending:
+            image = self.load_image(file_name)
+            self._store(key, numpy.ravel(self.get_features(image)))
+        return self._lookup(key)
+
+    def _lookup(self, key):
+        """ Returns the cached vector for key, marking it as just used. """
+        self._clock += 1
+        if key in self._pending:
+            self._pending[key][1] = self._clock
+            return self._pending[key][0]
+
+        entry = self._index[key]
+        entry[1] = self._clock
+        return self._matrix[entry[0]]
+
+    def _store(self, key, vector):
+        """ Adds a new vector to be written on the next flush. """
+        self._clock += 1
+        self._pending[key] = [numpy.asarray(vector, dtype=numpy.float64),
+                              self._clock]
+
+    def flush(self):
+        """ Appends any new vectors to the matrix and writes the index,
+            compacting the matrix when over max_entries. The last use of
+            vectors that were only read is saved with the next new vectors.
+        """
+        if not self._pending:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        if len(self._index) + len(self._pending) > self.max_entries:
+            self._compact()
+        else:
+            self._append()
+        self._write_index()
+
+    def __len__(self):
+        return len(self._index) + len(self._pending)
+
+    def _load(self):
+        """ Opens the cached matrix and index, starting empty when either is
+            missing or they do not agree.
+        """
+        self._pending = {}
+        self._index = {}
+        self._matrix = None
+        self._rows = 0
+        self._width = None
+        self._clock = 0
+        try:
+            with open(self._index_file) as index:
+                saved = json.load(index)
+            (rows, width) = (saved["rows"], saved["width"])
+            if rows and os.path.getsize(self._matrix_file) < \
+               rows * width * numpy.dtype(numpy.float64).itemsize:
+                return
+        except (IOError, OSError, ValueError, KeyError):
+            return
+        if any(row >= rows for (row, _) in saved["entries"].values()):
+            return
+        self._index = saved["entries"]
+        self._clock = saved["clock"]
+        (self._rows, self._width) = (rows, width)
+        self._open_matrix()
+
+    def _open_matrix(self):
+        """ Memory maps the rows of the matrix that are in use. """
+        if self._rows == 0:
+            self._matrix = None
+        else:
+            self._matrix = numpy.memmap(self._matrix_file, dtype=numpy.float64,
+                                        mode='r', shape=(self._rows, self._width))
+
+    def _append(self):
+        """ Writes the pending vectors after the rows already in the matrix,
+            dropping anything a flush that never finished left past them.
+        """
+        keys = list(self._pending)
+        vectors = self._check_sizes([ self._pending[key][0] for key in keys ])
+        with open(self._matrix_file, 'ab') as saved:
+            saved.truncate(self._rows * self._width *
+                           numpy.dtype(numpy.float64).itemsize)
+            saved.write(numpy.vstack(vectors).astype(numpy.float64).tobytes())
+
+        for (row, key) in enumerate(keys, self._rows):
+            self._index[key] = [row, self._pending[key][1]]
+        self._rows += len(keys)
+        self._pending = {}
+        self._open_matrix()
+
+    def _compact(self):
+        """ Writes a new matrix holding the most recently used of the cached
+            and pending vectors, COMPACT_FRACTION of max_entries of them.
+        """
+        entries = [ (last_use, key, self._matrix, row) \
+                    for (key, (row, last_use)) in self._index.items() ]
+        entries.extend((last_use, key, None, vector) \
+                       for (key, (vector, last_use)) in self._pending.items())
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        entries = entries[:max(int(COMPACT_FRACTION * self.max_entries), 1)]
+        vectors = self._check_sizes([ _vector(entry) for entry in entries ])
+
+        partial = self._matrix_file + ".partial"
+        with open(partial, 'wb') as saved:
+            saved.write(numpy.vstack(vectors).astype(numpy.float64).tobytes())
+        os.rename(partial, self._matrix_file)
+
+        self._index = dict((key, [row, last_use]) for \
+                           (row, (last_use, key, _, _)) in enumerate(entries))
+        self._rows = len(entries)
+        self._pending = {}
+        self._open_matrix()
+
+    def _check_sizes(self, vectors):
+        """ Raises a ValueError unless the vectors all have the size of the
+            cached ones, which is set by the first vectors written.
+        """
+        sizes = set(len(vector) for vector in vectors)
+        if self._width is not None:
+            sizes.add(self._width)
+        if len(sizes) > 1:
+            raise ValueError("%s returned features of sizes %s" %
+                             (self.get_features, sorted(sizes)))
+        self._width = sizes.pop()
+        return vectors
+
+    def _write_index(self):
+        """ Writes the index next to the matrix. """
+        partial = self._index_file + ".partial"
+        with open(partial, 'w') as index:
+            json.dump({"clock": self._clock, "rows": self._rows,
+                       "width": self._width, "entries": self._index}, index)
+        os.rename(partial, self._index_file)
+
+
+def _vector(entry):
+    """ Returns the feature vector of a (last_use, key, matrix, row) entry,
+        where a pending entry holds the vector itself as its row.
+    """
+    (_, _, matrix, row) = entry
+    if matrix is None:
+        return row
+    return matrix[row]
+
+
+def _drop_stale(directory, name, current):
+    """ Removes the cache directories of older versions of the extractor. """
+    if not os.path.isdir(directory):
+        return
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if entry.rsplit("-", 1)[0] == name and path != current:
+            shutil.rmtree(path, ignore_errors=True)
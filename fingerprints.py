@@ -0,0 +1,125 @@
+""" Contains helpers that fingerprint training data and feature extractors, so
+    saved results can tell when what they were built from has changed.
+"""
+
+import hashlib
+import os
+import sys
+import types
+
+# modules under this directory are part of the project, and the functions in
+# them are followed when hashing an extractor
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def file_hash(file_name, block_size=1 << 20):
+    """ Returns the sha1 hex digest of the contents of the file. """
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as data:
+        block = data.read(block_size)
+        while block:
+            digest.update(block)
+            block = data.read(block_size)
+    return digest.hexdigest()
+
+
+def manifest_hash(file_names, labels):
+    """ Returns a sha1 hex digest of a list of training files and their
+        labels that changes whenever a file's name, contents, label or
+        position does.
+    """
+    digest = hashlib.sha1()
+    for (file_name, label) in zip(file_names, labels):
+        digest.update(("%s\0%s\0%s\n" % (file_name, file_hash(file_name),
+                                         label)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def extractor_identity(get_features):
+    """ Returns a string naming a feature extractor along with a hash of its
+        code, so that editing the function, or any project function it calls
+        by name or through a project module (like profiles.centroid), changes
+        the identity.
+
+        The name is taken from the file the extractor is defined in rather
+        than its module, which is __main__ when that file is run as a script.
+    """
+    code = getattr(get_features, '__code__', None)
+    if code is None:
+        code = getattr(getattr(type(get_features), '__call__', None),
+                       '__code__', None)
+    source = "<unknown>" if code is None else \
+        os.path.splitext(os.path.basename(code.co_filename))[0]
+    name = "%s.%s" % (source, getattr(get_features, '__qualname__',
+                                      getattr(get_features, '__name__',
+                                              type(get_features).__name__)))
+    digest = hashlib.sha1()
+    _hash_function(get_features, digest, set())
+    return "%s:%s" % (name, digest.hexdigest()[:16])
+
+
+def _hash_function(function, digest, seen):
+    """ Adds the code of function, and of the project functions it refers to
+        by name or as attributes of project modules, to digest.
+    """
+    code = getattr(function, '__code__', None)
+    if code is None:
+        # a callable object, hash the code of its __call__ instead
+        call = getattr(type(function), '__call__', None)
+        code = getattr(call, '__code__', None)
+        if code is None:
+            digest.update(repr(function).encode('utf-8'))
+            return
+        function = call
+    if code in seen:
+        return
+    seen.add(code)
+
+    _hash_code(code, digest)
+    digest.update(repr((getattr(function, '__defaults__', None),
+                        getattr(function, '__kwdefaults__', None))).encode('utf-8'))
+    scope = getattr(function, '__globals__', {})
+    names = _referred_names(code)
+    modules = [ scope[name] for name in names \
+                if isinstance(scope.get(name), types.ModuleType) and \
+                _in_project(scope[name].__name__) ]
+    for name in names:
+        # a name is either a global or an attribute, like centroid in
+        # profiles.centroid, of one of the modules the function uses
+        candidates = [ scope.get(name) ] + \
+            [ getattr(module, name, None) for module in modules ]
+        for referred in candidates:
+            if isinstance(referred, types.FunctionType) and \
+               _in_project(referred.__module__):
+                _hash_function(referred, digest, seen)
+
+
+def _referred_names(code):
+    """ Returns the global and attribute names used by a code object and any
+        functions nested in it, in order.
+    """
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.extend(_referred_names(const))
+    return names
+
+
+def _in_project(module_name):
+    """ Returns whether the named module is a source file of this project. """
+    module_file = getattr(sys.modules.get(module_name), '__file__', None)
+    if module_file is None:
+        return False
+    return os.path.abspath(module_file).startswith(_PROJECT_DIR + os.sep)
+
+
+def _hash_code(code, digest):
+    """ Adds a code object's bytecode, names and constants to digest,
+        including those of any nested functions.
+    """
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(const, digest)
+        else:
+            digest.update(repr(const).encode('utf-8'))
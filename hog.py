@@ -1,33 +1,123 @@
 #!/usr/bin/env python
-import os
 import sys
-from numpy import *
 
 from scipy import ndimage
 from scipy import misc
-import matplotlib.pyplot as plt
 import numpy
 import math
 
-#Transforms and image into a histogram of oriented gradients
-#image - image to be transformed (expects dtype of float32)
-#num_of_orientations - number of bins to sort the orientations
-#returns a list of numbers corresponding to each bin
-def hog(image, num_of_orientations=36):
-    dx_filter = numpy.array([[0,0,0], [1, 0, -1], [0,0,0]])
-    dx = ndimage.convolve(image, dx_filter, mode='constant', cval=0.0)
+#Transforms an image into a histogram of oriented gradients
+#image - 2D grayscale image (color images are averaged over their channels)
+#num_of_orientations - number of bins to sort the unsigned orientations
+#cell_size - width and height in pixels of the cells that get a histogram
+#block_size - width and height in cells of the blocks the histograms are
+#             normalized over, blocks overlap by all but one cell
+#shape - if given, the image is resampled to this (rows, columns) first so
+#        every image gives the same number of features for the same cost
+#returns a flat vector of the normalized block histograms
+def hog(image, num_of_orientations=9, cell_size=8, block_size=2, shape=None):
+    image = numpy.asarray(image, dtype=numpy.float64)
+    if image.ndim == 3:
+        image = image.mean(axis=2)
+    return hog_batch(image[numpy.newaxis], num_of_orientations, cell_size,
+                     block_size, shape)[0]
 
-    dy_filter = numpy.array([[0,1,0], [0, 0, 0], [0,-1,0]])
-    dy = ndimage.convolve(image, dy_filter, mode='constant', cval=0.0)
+#Computes hog for every image in a stack of same sized images
+#images - (k x rows x columns) array, or (k x rows x columns x channels)
+#returns a (k x features) array with the features of each image in a row
+def hog_batch(images, num_of_orientations=9, cell_size=8, block_size=2,
+              shape=None):
+    images = numpy.asarray(images, dtype=numpy.float64)
+    if images.ndim == 4:
+        images = images.mean(axis=3)
+    if shape is not None:
+        zoom = (1, float(shape[0]) / images.shape[1],
+                float(shape[1]) / images.shape[2])
+        images = ndimage.zoom(images, zoom, order=1)
 
-    return arccos(dx)
-#    return numpy.histogram(dx, bins=num_of_orientations)
+    (magnitude, orientation) = gradients(images)
+    cells = cell_histograms(magnitude, orientation, num_of_orientations,
+                            cell_size)
+    blocks = normalize_blocks(cells, block_size)
+    return blocks.reshape((images.shape[0], -1))
+
+#Finds the gradient of each image in a stack with centered differences
+#returns (magnitude, orientation) with orientations unsigned in [0, pi)
+def gradients(images):
+    dx = numpy.zeros_like(images)
+    dy = numpy.zeros_like(images)
+    dx[:, :, 1:-1] = images[:, :, 2:] - images[:, :, :-2]
+    dy[:, 1:-1, :] = images[:, 2:, :] - images[:, :-2, :]
+
+    magnitude = numpy.hypot(dx, dy)
+    orientation = numpy.mod(numpy.arctan2(dy, dx), math.pi)
+    return magnitude, orientation
+
+#Sums the gradient magnitudes of each cell into orientation bins, splitting
+#each pixel's vote linearly between the two nearest bins. The per bin sums
+#are read off integral images, so any cell is four lookups.
+#returns a (k x cell rows x cell columns x num_of_orientations) array
+def cell_histograms(magnitude, orientation, num_of_orientations, cell_size):
+    (k, rows, columns) = magnitude.shape
+    cell_rows = rows // cell_size
+    cell_columns = columns // cell_size
+    if cell_rows == 0 or cell_columns == 0:
+        raise ValueError("images of %ix%i are smaller than a %i pixel cell" %
+                         (rows, columns, cell_size))
+
+    position = orientation / math.pi * num_of_orientations - 0.5
+    lower = numpy.floor(position)
+    upper_weight = position - lower
+    lower = lower.astype(numpy.intp) % num_of_orientations
+    upper = (lower + 1) % num_of_orientations
+
+    #cast the votes into a zero padded (k x bins x rows x columns) grid
+    shape = (k, num_of_orientations, rows + 1, columns + 1)
+    pixels = numpy.indices((k, rows, columns))
+    lower_index = numpy.ravel_multi_index(
+        (pixels[0], lower, pixels[1] + 1, pixels[2] + 1), shape)
+    upper_index = numpy.ravel_multi_index(
+        (pixels[0], upper, pixels[1] + 1, pixels[2] + 1), shape)
+    size = k * num_of_orientations * (rows + 1) * (columns + 1)
+    votes = numpy.bincount(lower_index.ravel(),
+                           (magnitude * (1.0 - upper_weight)).ravel(), size) + \
+        numpy.bincount(upper_index.ravel(),
+                       (magnitude * upper_weight).ravel(), size)
+    votes = votes.reshape(shape)
+
+    integral = votes.cumsum(axis=2).cumsum(axis=3)
+    ys = numpy.arange(cell_rows + 1) * cell_size
+    xs = numpy.arange(cell_columns + 1) * cell_size
+    sums = integral[:, :, ys[1:, numpy.newaxis], xs[1:]] - \
+        integral[:, :, ys[:-1, numpy.newaxis], xs[1:]] - \
+        integral[:, :, ys[1:, numpy.newaxis], xs[:-1]] + \
+        integral[:, :, ys[:-1, numpy.newaxis], xs[:-1]]
+    return sums.transpose((0, 2, 3, 1))
+
+#Groups the cell histograms into overlapping blocks of block_size cells and
+#L2-Hys normalizes each block: scale to unit length, clip at 0.2, rescale
+#returns a (k x block rows x block columns x block features) array
+def normalize_blocks(cells, block_size, clip=0.2, eps=1e-6):
+    (k, cell_rows, cell_columns, bins) = cells.shape
+    block_rows = max(cell_rows - block_size + 1, 1)
+    block_columns = max(cell_columns - block_size + 1, 1)
+
+    blocks = numpy.concatenate(
+        [ cells[:, dy:dy + block_rows, dx:dx + block_columns, :] \
+          for dy in range(min(block_size, cell_rows)) \
+          for dx in range(min(block_size, cell_columns)) ], axis=3)
+
+    norms = numpy.sqrt((blocks ** 2).sum(axis=3, keepdims=True) + eps ** 2)
+    blocks = numpy.minimum(blocks / norms, clip)
+    norms = numpy.sqrt((blocks ** 2).sum(axis=3, keepdims=True) + eps ** 2)
+    return blocks / norms
 
 if __name__ == '__main__':
-    image = misc.imread(sys.argv[1], flatten=True).astype(numpy.uint8)
-    image = (image > image.mean()).astype(numpy.uint8)
-    
-    plt.imshow(hog(image), cmap=plt.cm.gray)
-    plt.show()
+    import matplotlib.pyplot as plt
 
+    image = misc.imread(sys.argv[1], flatten=True)
 
+    features = hog(image)
+    print("%i features" % len(features))
+    plt.plot(features)
+    plt.show()
@@ -0,0 +1,82 @@
+""" Contains helpers for reporting the progress of iterative algorithms.
+
+    The iterative methods in clustering take a callback that is called once
+    per step with a dict describing it:
+
+        algorithm  -- 'em' or 'kmeans'
+        iteration  -- the iteration the step belongs to, starting at 0
+        step       -- 'E' or 'M' for em, 'assign' or 'update' for kmeans
+        seconds    -- wall time the step took
+        memory     -- bytes of memory in use by the process after the step
+
+    along with the log_likelihood (em), inertia (kmeans) or the largest
+    change in any parameter (delta) when the step computes them.
+"""
+
+import json
+import os
+import sys
+import time
+
+def report(callback, algorithm, iteration, step, started, **values):
+    """ Builds the record for a step that began at time started and passes
+        it to callback, if there is one.
+    """
+    if callback is None:
+        return
+    record = {
+        "algorithm": algorithm,
+        "iteration": iteration,
+        "step": step,
+        "seconds": time.time() - started,
+        "memory": memory_in_use(),
+    }
+    record.update(values)
+    callback(record)
+
+
+def memory_in_use():
+    """ Returns the resident memory of this process in bytes.
+
+        Reads /proc where it exists and otherwise falls back to the peak
+        resident size reported by getrusage.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux reports kilobytes, macs report bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def print_reporter(record):
+    """ A callback that prints a one line summary of each step. """
+    values = ", ".join("%s=%s" % (key, record[key]) for key in \
+                       ("log_likelihood", "inertia", "delta") if key in record)
+    print("%s %i %s %.4fs %s" % (record["algorithm"], record["iteration"],
+                                 record["step"], record["seconds"], values))
+
+
+class JsonLinesReporter(object):
+    """ A callback that writes each step as a line of JSON to a file name or
+        an open file.
+    """
+    def __init__(self, destination):
+        if hasattr(destination, "write"):
+            self._stream = destination
+            self._owned = False
+        else:
+            self._stream = open(destination, "a")
+            self._owned = True
+
+    def __call__(self, record):
+        self._stream.write(json.dumps(record, sort_keys=True) + "\n")
+        self._stream.flush()
+
+    def close(self):
+        """ Closes the file if this reporter opened it. """
+        if self._owned:
+            self._stream.close()
@@ -4,52 +4,53 @@ import sys
 
 import json
 
-from scipy import ndimage
 from scipy import misc
 import matplotlib.pyplot as plt
 import numpy
 
+from pdf_pages import load_pages
 from seperate_staffs import *
 
 def learn(filename):
-    image = misc.imread(filename)
-    plt.imshow(image)
-    plt.show()
-
-    image_counter = 0
-    staffs = seperate_staffs(image)
     results = json.loads(open("learn/learn.json").read())
     image_counter = len(results) + 1
-    
-    for staff in staffs:
-        transposed_staff = ndimage.rotate(staff, -90)
-        notes = seperate_notes(transposed_staff)
-        for i in range(len(notes)):
-            filename = 'learn/{0}.jpg'.format(str(image_counter).zfill(5))
-            misc.imsave(filename, notes[i])
-            image_counter = image_counter + 1
 
-            plt.imshow(ndimage.rotate(notes[i], 90))
-            plt.ion()
-            plt.show()
+    for image in load_pages(filename):
+        plt.imshow(image)
+        plt.show()
+
+        staffs = seperate_staffs(image)
+        for staff in staffs:
+            # staffs are boolean masks, turn them exactly instead of
+            # spline rotating them
+            transposed_staff = numpy.rot90(staff, -1)
+            notes = seperate_notes(transposed_staff)
+            for i in range(len(notes)):
+                filename = 'learn/{0}.jpg'.format(str(image_counter).zfill(5))
+                misc.imsave(filename, notes[i].astype(numpy.uint8) * 255)
+                image_counter = image_counter + 1
+
+                plt.imshow(numpy.rot90(notes[i]))
+                plt.ion()
+                plt.show()
             
-            thing = {}
+                thing = {}
             
-            note_type = raw_input("Type?: ")
-            while not note_type in ["note", "treble", "ignore", "bass", "time", "bar", "rest"]:
-                note_type = raw_input("Retry Type?: ")
-            thing["type"] = note_type
+                note_type = raw_input("Type?: ")
+                while not note_type in ["note", "treble", "ignore", "bass", "time", "bar", "rest"]:
+                    note_type = raw_input("Retry Type?: ")
+                thing["type"] = note_type
 
-            if note_type == "note":
-                note_pitch = raw_input("Pitch?: ")
-                thing["pitch"] = int(note_pitch)
-                note_length = raw_input("Length?: ")
-                thing["length"] = float(note_length)
-            if note_type == "rest":
-                note_length = raw_input("Length?: ")
-                thing["length"] = float(note_length)
-            print({filename:thing})
-            results.append({filename:thing})
+                if note_type == "note":
+                    note_pitch = raw_input("Pitch?: ")
+                    thing["pitch"] = int(note_pitch)
+                    note_length = raw_input("Length?: ")
+                    thing["length"] = float(note_length)
+                if note_type == "rest":
+                    note_length = raw_input("Length?: ")
+                    thing["length"] = float(note_length)
+                print({filename:thing})
+                results.append({filename:thing})
             
             
     json_result = json.dumps(results)
@@ -60,6 +61,6 @@ def learn(filename):
 
 
 if __name__ == "__main__":
-    assert len(sys.argv) > 0, "Usage: <filename> - path to image file to learn"
+    assert len(sys.argv) > 0, "Usage: <filename> - path to image or PDF file to learn"
     filename = sys.argv[1]
     learn(filename)
@@ -0,0 +1,174 @@
+""" Contains the manifest of labeled images, learn/learn.json, loaded once
+    into integer coded columns so the classifiers can select and split the
+    images without going back to the raw JSON.
+"""
+
+# pylint: disable=C0103
+
+import json
+
+import numpy
+
+import cross_validation
+
+MISSING_PITCH = -32768
+
+class LabelEncoder(object):
+    """ Gives each distinct label an integer code, in the order the labels
+        are first seen. The codes are kept in a dict, so encoding a label is
+        a single lookup, and classes lists the label of each code.
+    """
+    def __init__(self, labels=()):
+        self.classes = []
+        self._codes = {}
+        for label in labels:
+            self.encode(label)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def __contains__(self, label):
+        return label in self._codes
+
+    def encode(self, label):
+        """ Returns the code of label, giving it the next code if it has not
+            been seen before.
+        """
+        code = self._codes.get(label)
+        if code is None:
+            code = len(self.classes)
+            self._codes[label] = code
+            self.classes.append(label)
+        return code
+
+    def encode_all(self, labels):
+        """ Returns the codes of the labels as an int array. """
+        return numpy.array([ self.encode(label) for label in labels ],
+                           dtype=numpy.intp)
+
+    def decode(self, code):
+        """ Returns the label with the given code. """
+        return self.classes[code]
+
+
+class Manifest(object):
+    """ The file name and labels of every labeled image, in the order of the
+        manifest file, as columns:
+
+            file_names  -- the file name of each image
+            type_codes  -- int array, the code of each image's type in types
+            pitches     -- int array, the pitch of each note, MISSING_PITCH
+                           otherwise
+            lengths     -- float array, the length of each note or rest, nan
+                           otherwise
+
+        where types is the LabelEncoder of the type names. The indices of the
+        images of each type are found once up front.
+    """
+    def __init__(self, entries):
+        self.file_names = []
+        self.types = LabelEncoder()
+        type_codes = []
+        pitches = []
+        lengths = []
+        for entry in entries:
+            for (file_name, data) in entry.items():
+                self.file_names.append(file_name)
+                type_codes.append(self.types.encode(data["type"]))
+                pitches.append(data.get("pitch", MISSING_PITCH))
+                lengths.append(data.get("length", numpy.nan))
+
+        self.type_codes = numpy.array(type_codes, dtype=numpy.intp)
+        self.pitches = numpy.array(pitches, dtype=numpy.int64)
+        self.lengths = numpy.array(lengths, dtype=numpy.float64)
+
+        # group the images by type with one stable sort
+        order = numpy.argsort(self.type_codes, kind='mergesort')
+        bounds = numpy.searchsorted(self.type_codes[order],
+                                    numpy.arange(len(self.types) + 1))
+        self._by_type = dict((name, order[bounds[code]:bounds[code + 1]]) \
+                             for (code, name) in enumerate(self.types.classes))
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def type_indices(self, type_name):
+        """ Returns the indices of every image of the given type. """
+        return self._by_type.get(type_name, numpy.array([], dtype=numpy.intp))
+
+    def indices(self, *type_names):
+        """ Returns the indices of every image of any of the given types, in
+            manifest order.
+        """
+        if not type_names:
+            return numpy.array([], dtype=numpy.intp)
+        return numpy.sort(numpy.concatenate([ self.type_indices(name) \
+                                              for name in type_names ]))
+
+    def excluding(self, *type_names):
+        """ Returns the indices of every image that is not of any of the
+            given types, in manifest order.
+        """
+        keep = numpy.ones(len(self), dtype=bool)
+        keep[self.indices(*type_names)] = False
+        return numpy.flatnonzero(keep)
+
+    def label(self, i):
+        """ Returns the labels of the i-th image as a dict in the manifest
+            file format.
+        """
+        return row_label(self.types.decode(self.type_codes[i]),
+                         self.pitches[i], self.lengths[i])
+
+
+def row_label(type_name, pitch, length):
+    """ Builds the labels of an image in the manifest file format from its
+        columns, leaving out a pitch of MISSING_PITCH and a length of nan.
+    """
+    label = {"type": type_name}
+    if pitch != MISSING_PITCH:
+        label["pitch"] = int(pitch)
+    if not numpy.isnan(length):
+        label["length"] = float(length)
+    return label
+
+
+def load_manifest(file_location):
+    """ Reads a manifest file in the learn.json format. """
+    with open(file_location, 'r') as manifest_file:
+        return Manifest(json.load(manifest_file))
+
+
+def stratified_split(indices, codes, test_ratio, seed=None):
+    """ Splits indices into (train, test), holding out int(test_ratio * n)
+        of the n indices for testing. The test images are shared out over
+        the codes in proportion to how many indices have each code, with
+        the images left over after rounding down going to the codes with
+        the largest remainders (ties broken at random).
+    """
+    indices = numpy.asarray(indices, dtype=numpy.intp)
+    codes = numpy.asarray(codes, dtype=numpy.intp)
+    if not 0.0 <= test_ratio <= 1.0:
+        raise ValueError("test_ratio must be in [0, 1], got %r" % test_ratio)
+    seeded = numpy.random.RandomState(seed)
+    num_test = int(test_ratio * len(indices))
+
+    order = cross_validation.shuffled_runs(codes, seeded)
+    sorted_codes = codes[order]
+
+    # share the test images out over the codes by largest remainder
+    sizes = numpy.bincount(sorted_codes, minlength=1)
+    quotas = sizes * (num_test / float(max(len(indices), 1)))
+    shares = numpy.floor(quotas).astype(numpy.intp)
+    remainders = quotas - shares
+    ranked = numpy.lexsort((seeded.random_sample(len(sizes)), -remainders))
+    shares[ranked[:max(num_test - shares.sum(), 0)]] += 1
+
+    # the position of each index within the run of its code
+    firsts = numpy.searchsorted(sorted_codes, sorted_codes)
+    rank = numpy.arange(len(order)) - firsts
+    test = rank < shares[sorted_codes]
+    if test.sum() != num_test:
+        raise ValueError("split held out %i of %i indices, expected %i" %
+                         (test.sum(), len(indices), num_test))
+    return numpy.sort(indices[order[~test]]), numpy.sort(indices[order[test]])
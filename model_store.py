@@ -0,0 +1,73 @@
+""" Saves and loads trained GDA classifiers.
+
+    A saved model is a single .npz file holding the arrays phi, mu, sig,
+    precision and log_det of the clustering.GDAModel, plus a header entry
+    with a small JSON document:
+
+        format     -- the version of this layout
+        label_map  -- the label of each class index
+        extractor  -- the fingerprints.extractor_identity of the features
+        manifest   -- the fingerprints.manifest_hash of the training set
+        reg        -- the covariance regularization passed to clustering.gda
+"""
+
+import json
+import os
+
+import numpy
+
+import clustering
+
+FORMAT = 1
+
+def save_model(file_name, model, label_map, extractor, manifest, reg=0.0):
+    """ Saves the model and its header to file_name, replacing any model
+        already there only once the new one is completely written.
+    """
+    header = {
+        "format": FORMAT,
+        "label_map": list(label_map),
+        "extractor": extractor,
+        "manifest": manifest,
+        "reg": reg,
+    }
+
+    partial = file_name + ".partial"
+    with open(partial, 'wb') as saved:
+        numpy.savez(saved, header=numpy.array(json.dumps(header)),
+                    phi=model.phi, mu=model.mu, sig=model.sig,
+                    precision=model.precision, log_det=model.log_det)
+    os.rename(partial, file_name)
+
+
+def load_model(file_name):
+    """ Loads a model saved by save_model.
+
+        Returns (model, header) where header is the dict described above.
+    """
+    with numpy.load(file_name) as saved:
+        header = json.loads(str(saved["header"]))
+        if header.get("format") != FORMAT:
+            raise ValueError("%s has unsupported model format %r" %
+                             (file_name, header.get("format")))
+        model = clustering.GDAModel(saved["phi"], saved["mu"], saved["sig"],
+                                    saved["precision"], saved["log_det"])
+    return (model, header)
+
+
+def load_if_current(file_name, extractor, manifest, reg=0.0):
+    """ Loads the model saved at file_name if it was trained with the given
+        feature extractor and regularization on the given training set.
+
+        Returns (model, header), or None when there is no usable model.
+    """
+    if not os.path.exists(file_name):
+        return None
+    try:
+        (model, header) = load_model(file_name)
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+    if header["extractor"] != extractor or header["manifest"] != manifest or \
+       header.get("reg", 0.0) != reg:
+        return None
+    return (model, header)
@@ -130,7 +130,7 @@ class MusicSheet(object):
         """ This will add a new measure to the end of the compisiton
             so that more notes can be added. This is somewhat like
             adding a bar line."""
-        self._measures.appendleft(Measure(deque()))
+        self._measures.append(Measure(deque()))
 
     def add_note_to_measure(self, note_type, pitch, accidental):
         """ This will append the note to the end of the last measure. This will
@@ -146,10 +146,9 @@ class MusicSheet(object):
             raise IllegalArgumentException("accidental must be a valid type"
                                            " from enum Accidental.")
 
-        self._measures[len(self._measures) - 1].notes.appendleft(Note(note_type,
-                                                                      pitch,
-                                                                      accidental
-                                                                      ))
+        self._measures[len(self._measures) - 1].notes.append(Note(note_type,
+                                                                  pitch,
+                                                                  accidental))
 
     def save_file(self, filename):
         """ This will save the Sheet Music to a file so that it can be loaded
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+""" Packs the labeled note images into a single memory mappable file.
+
+    The file starts with the magic bytes NOTEPACK, a little endian uint32
+    giving the length of a JSON header, and the header itself. The header
+    lists the file name of every image, the type names, and where each of
+    these sections starts, along with its dtype and shape:
+
+        heights  -- int32, the rows of each image
+        widths   -- int32, the columns of each image
+        types    -- int16, the index of each image's type in the type names
+        pitches  -- int16, the pitch of each note, manifest.MISSING_PITCH
+                    otherwise
+        lengths  -- float32, the length of each note or rest, nan otherwise
+        offsets  -- int64, where each image starts in the images section
+        images   -- uint8, every image back to back, row by row, to the end
+                    of the file. Grayscale images take a byte per pixel; when
+                    packed as bits they are ink masks with each row padded
+                    to a whole byte.
+
+    Every section starts on a 64 byte boundary and is read as a numpy.memmap,
+    so opening the file reads nothing but the header, and a grayscale image
+    is a view straight into the file.
+
+    run.py reads the labeled images from learn/learn.pack instead of
+    decoding each one while that pack is up to date, see open_current.
+
+    Usage: packed_dataset.py <learn.json> <output> [--bits]
+"""
+
+import json
+import os
+import struct
+import sys
+
+import numpy
+from scipy import misc
+
+import manifest
+
+MAGIC = b"NOTEPACK"
+ALIGNMENT = 64
+
+def pack(json_location, output, bits=False, load_image=None):
+    """ Packs the images listed in json_location (in the learn.json format)
+        into output, decoding one image at a time. With bits, images are
+        stored as bit packed ink masks.
+    """
+    if load_image is None:
+        load_image = _load_gray
+    labeled = manifest.load_manifest(json_location)
+    file_names = labeled.file_names
+    count = len(file_names)
+
+    type_names = labeled.types.classes
+    columns = [
+        ("heights", numpy.zeros(count, dtype=numpy.int32)),
+        ("widths", numpy.zeros(count, dtype=numpy.int32)),
+        ("types", labeled.type_codes.astype(numpy.int16)),
+        ("pitches", labeled.pitches.astype(numpy.int16)),
+        ("lengths", labeled.lengths.astype(numpy.float32)),
+        ("offsets", numpy.zeros(count, dtype=numpy.int64)),
+    ]
+    header = {
+        "file_names": file_names,
+        "type_names": type_names,
+        "bits": bool(bits),
+        "sections": {},
+    }
+
+    # lay the sections out after the header, whose length depends on the
+    # offsets written into it, so grow the guess until it fits
+    start = ALIGNMENT
+    while True:
+        offset = start
+        for (name, column) in columns:
+            header["sections"][name] = [offset, column.dtype.name,
+                                        list(column.shape)]
+            offset = _align(offset + column.nbytes)
+        header["sections"]["images"] = [offset, "uint8", None]
+        encoded = json.dumps(header).encode('utf-8')
+        if len(MAGIC) + 4 + len(encoded) <= start:
+            break
+        start = _align(len(MAGIC) + 4 + len(encoded))
+
+    (heights, widths, offsets) = (columns[0][1], columns[1][1], columns[5][1])
+    with open(output, 'wb') as packed:
+        packed.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+        for (name, column) in columns:
+            packed.seek(header["sections"][name][0])
+            packed.write(column.tobytes())
+        packed.truncate(offset)
+        packed.seek(offset)
+
+        position = 0
+        for (i, file_name) in enumerate(file_names):
+            image = load_image(file_name)
+            (heights[i], widths[i]) = image.shape
+            offsets[i] = position
+            if bits:
+                pixels = numpy.packbits(image < image.mean(), axis=1)
+            else:
+                pixels = numpy.clip(image, 0, 255).astype(numpy.uint8)
+            packed.write(pixels.tobytes())
+            position += pixels.nbytes
+
+        for (name, column) in (("heights", heights), ("widths", widths),
+                               ("offsets", offsets)):
+            packed.seek(header["sections"][name][0])
+            packed.write(column.tobytes())
+
+    return PackedDataset(output)
+
+
+class PackedDataset(object):
+    """ Reads a file written by pack. Every column is a numpy.memmap, so
+        indexing only touches the pages it needs.
+    """
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as packed:
+            if packed.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a packed dataset" % file_name)
+            (length,) = struct.unpack("<I", packed.read(4))
+            header = json.loads(packed.read(length).decode('utf-8'))
+            packed.seek(0, 2)
+            size = packed.tell()
+
+        self.file_names = header["file_names"]
+        self._rows = None
+        self.type_names = header["type_names"]
+        self.bits = header["bits"]
+        for (name, (offset, dtype, shape)) in header["sections"].items():
+            if shape is None:
+                shape = [size - offset]
+            if 0 in shape:
+                column = numpy.zeros(shape, dtype=dtype)
+            else:
+                column = numpy.memmap(file_name, dtype=dtype, mode='r',
+                                      offset=offset, shape=tuple(shape))
+            setattr(self, name, column)
+
+    def __len__(self):
+        return len(self.file_names)
+
+    def image(self, i):
+        """ Returns the i-th image. A grayscale image is a view into the
+            file; a bit packed one is unpacked into a boolean ink mask.
+        """
+        (height, width) = (int(self.heights[i]), int(self.widths[i]))
+        start = int(self.offsets[i])
+        if self.bits:
+            row_bytes = (width + 7) // 8
+            packed = self.images[start:start + height * row_bytes]
+            mask = numpy.unpackbits(packed.reshape((height, row_bytes)), axis=1)
+            return mask[:, :width].astype(bool)
+        return self.images[start:start + height * width].reshape((height, width))
+
+    def load_image(self, file_name):
+        """ Returns the image packed from file_name, as image does, so the
+            pack can stand in for misc.imread wherever images are loaded by
+            name. Bit packed images are returned as 0 or 255 whitespace.
+        """
+        if self._rows is None:
+            self._rows = dict((name, i) for (i, name) \
+                              in enumerate(self.file_names))
+        if file_name not in self._rows:
+            raise KeyError("%s is not in the packed dataset" % file_name)
+        image = self.image(self._rows[file_name])
+        if self.bits:
+            return (~image).astype(numpy.uint8) * 255
+        return image
+
+    def label(self, i):
+        """ Returns the labels of the i-th image as a dict in the learn.json
+            format.
+        """
+        return manifest.row_label(self.type_names[self.types[i]],
+                                  self.pitches[i], self.lengths[i])
+
+    def indices(self, type_name):
+        """ Returns the indices of every image of the given type. """
+        if type_name not in self.type_names:
+            return numpy.array([], dtype=numpy.intp)
+        return numpy.flatnonzero(self.types == self.type_names.index(type_name))
+
+
+def open_current(file_name, json_location):
+    """ Opens the pack at file_name if it was written after json_location
+        was last changed, otherwise returns None.
+    """
+    try:
+        if os.path.getmtime(file_name) < os.path.getmtime(json_location):
+            return None
+    except OSError:
+        return None
+    return PackedDataset(file_name)
+
+
+def _load_gray(file_name):
+    """ Reads an image file as a 2D grayscale array. """
+    return misc.imread(file_name, flatten=True)
+
+
+def _align(offset):
+    """ Rounds offset up to the next section boundary. """
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) > 2, "Usage: <learn.json> <output> [--bits]"
+    packed = pack(sys.argv[1], sys.argv[2], bits="--bits" in sys.argv[3:])
+    print("Packed %i images" % len(packed))
@@ -0,0 +1,127 @@
+""" Rasterizes the pages of PDF scores into grayscale arrays, one page at a
+    time, as they are asked for.
+
+    Rendering needs PyMuPDF, which is only imported once a page that is not
+    already cached has to be drawn. Rendered pages are kept in a cache
+    directory as .npy files named by the sha1 of the PDF, the page number
+    and the DPI, so a score is only ever rendered once at each resolution.
+"""
+
+import os
+
+import numpy
+from scipy import misc
+
+import fingerprints
+
+# where rendered pages are kept between runs, None to always render
+PAGE_CACHE_DIR = "cache/pages"
+
+DEFAULT_DPI = 150
+
+class PdfPages(object):
+    """ The pages of a PDF as 2D uint8 grayscale arrays. Pages are rendered
+        when they are indexed or iterated over, never all up front.
+    """
+    def __init__(self, file_name, dpi=DEFAULT_DPI, cache_dir=PAGE_CACHE_DIR):
+        self.file_name = file_name
+        self.dpi = dpi
+        self.cache_dir = cache_dir
+        self.digest = fingerprints.file_hash(file_name)
+        self._document = None
+        self._count = None
+
+    def __len__(self):
+        if self._count is None:
+            self._count = len(self._open())
+        return self._count
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError("page %i of a %i page document" %
+                             (number, len(self)))
+        return self.page(number)
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self.page(number)
+
+    def page(self, number):
+        """ Returns the page as a grayscale array. With a cache the page is
+            memory mapped from its cache file, so rows are only read as they
+            are used.
+        """
+        cached = self._cache_file(number)
+        if cached is not None and os.path.exists(cached):
+            return numpy.load(cached, mmap_mode='r')
+
+        image = self._render(number)
+        if cached is not None:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # write to a temporary name so a reader never sees half a page
+            partial = "%s.%i.tmp.npy" % (cached[:-len(".npy")], os.getpid())
+            numpy.save(partial, image)
+            os.rename(partial, cached)
+            return numpy.load(cached, mmap_mode='r')
+        return image
+
+    def close(self):
+        """ Closes the document if it was opened to render a page. """
+        if self._document is not None:
+            self._document.close()
+            self._document = None
+
+    def _cache_file(self, number):
+        """ Names the cache file of a page, or None with no cache. """
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, "%s-page%i-%idpi.npy" %
+                            (self.digest, number, self.dpi))
+
+    def _open(self):
+        """ Opens the document with PyMuPDF the first time it is needed. """
+        if self._document is None:
+            self._document = _pdf_library().open(self.file_name)
+        return self._document
+
+    def _render(self, number):
+        """ Draws a page at self.dpi straight into a grayscale array. """
+        library = _pdf_library()
+        zoom = self.dpi / 72.0
+        pixmap = self._open().load_page(number).get_pixmap(
+            matrix=library.Matrix(zoom, zoom), colorspace=library.csGRAY,
+            alpha=False)
+        rows = numpy.frombuffer(pixmap.samples, dtype=numpy.uint8)
+        rows = rows.reshape((pixmap.height, pixmap.stride))
+        return numpy.ascontiguousarray(rows[:, :pixmap.width])
+
+
+def load_pages(file_name, dpi=DEFAULT_DPI, cache_dir=PAGE_CACHE_DIR):
+    """ Yields each page of a score: every page of a PDF, or the image in
+        any other file, read with misc.imread.
+    """
+    if file_name.lower().endswith(".pdf"):
+        pages = PdfPages(file_name, dpi, cache_dir)
+        try:
+            for page in pages:
+                yield page
+        finally:
+            pages.close()
+    else:
+        yield misc.imread(file_name)
+
+
+def _pdf_library():
+    """ Imports PyMuPDF, which is only needed to render pages. """
+    try:
+        import pymupdf as library
+    except ImportError:
+        try:
+            import fitz as library
+        except ImportError:
+            raise ImportError("rendering PDF pages needs PyMuPDF "
+                              "(pip install pymupdf)")
+    return library
@@ -0,0 +1,77 @@
+""" Decodes images and extracts their features across a pool of processes. """
+
+import multiprocessing
+import pickle
+
+import numpy
+from scipy import misc
+
+import pools
+
+def featurize(file_names, get_features, processes=None, prefetch=None,
+              load_image=None):
+    """ Returns the (n x features) matrix of get_features applied to each of
+        the image files, in the order the files were given. With no files it
+        is an empty (0 x 0) matrix.
+
+        The files are decoded and featurized in a pool of processes (all
+        cores by default, processes=1 works in this process). At most
+        prefetch files, twice the number of workers by default, are in
+        flight at once, so finished features never pile up unread.
+
+        get_features and load_image are handed to the workers when they
+        start instead of with every file, so lambdas and closures work as
+        long as processes are forked.
+    """
+    if load_image is None:
+        load_image = misc.imread
+    file_names = list(file_names)
+    if not file_names:
+        return numpy.empty((0, 0))
+
+    if processes == 1 or len(file_names) < 2 or \
+       not _can_share(get_features, load_image):
+        return numpy.vstack([ _featurize_one(file_name, load_image,
+                                             get_features) \
+                              for file_name in file_names ])
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if prefetch is None:
+        prefetch = 2 * processes
+
+    pool = pools.start_pool(processes, get_features=get_features,
+                            load_image=load_image)
+    try:
+        rows = list(pools.bounded_map(pool, _worker_featurize, file_names,
+                                      prefetch))
+    finally:
+        pool.close()
+        pool.join()
+
+    return numpy.vstack(rows)
+
+
+def _featurize_one(file_name, load_image, get_features):
+    """ Decodes a single image and returns its features as a flat vector. """
+    return numpy.ravel(get_features(load_image(file_name)))
+
+
+def _worker_featurize(file_name):
+    """ Featurizes an image in a pool worker. """
+    return _featurize_one(file_name, pools.shared("load_image"),
+                          pools.shared("get_features"))
+
+
+def _can_share(*functions):
+    """ Returns whether the functions can be handed to pool workers: always
+        when workers are forked, otherwise only when they can be pickled.
+    """
+    get_start_method = getattr(multiprocessing, 'get_start_method', None)
+    if get_start_method is None or get_start_method() == 'fork':
+        return True
+    try:
+        pickle.dumps(functions)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
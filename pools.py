@@ -0,0 +1,48 @@
+""" Contains helpers for spreading work over a multiprocessing.Pool.
+
+    Data every job needs, like a training set or a feature extractor, is
+    handed to each worker once when it starts instead of with every job:
+    start_pool stores it in the worker by name, and jobs read it back with
+    shared. Work done in this process stores it with share instead.
+"""
+
+import collections
+import multiprocessing
+
+# the values shared with the jobs run in this process, by name
+_shared = {}
+
+def start_pool(processes, **values):
+    """ Starts a pool of processes workers, sharing the keyword arguments
+        with each of them as it starts.
+    """
+    return multiprocessing.Pool(processes, _share_all, (values,))
+
+
+def share(**values):
+    """ Shares the keyword arguments with jobs run in this process. """
+    _shared.update(values)
+
+
+def shared(name):
+    """ Returns the value shared under name. """
+    return _shared[name]
+
+
+def _share_all(values):
+    """ Pool initializer that shares the values in the worker. """
+    _shared.update(values)
+
+
+def bounded_map(pool, function, jobs, limit):
+    """ Applies function to each of jobs in the pool, yielding the results
+        in the order of the jobs. At most limit jobs are queued at once, so
+        finished results never pile up unread.
+    """
+    in_flight = collections.deque()
+    for job in jobs:
+        if len(in_flight) >= limit:
+            yield in_flight.popleft().get()
+        in_flight.append(pool.apply_async(function, (job,)))
+    while in_flight:
+        yield in_flight.popleft().get()
@@ -0,0 +1,89 @@
+""" Contains projection profile features for images of notes.
+
+    A projection profile is the fraction of ink in each row or each column
+    of an image, where ink is any pixel darker than the mean of the image.
+    Everything here works on a boolean view of the image, without rotating
+    or copying it.
+"""
+
+# pylint: disable=C0103
+
+import numpy
+
+def binarize(image):
+    """ Returns a boolean array that is true wherever the image is darker
+        than its mean. Color images are read from their first channel.
+    """
+    image = numpy.asarray(image)
+    if image.ndim == 3:
+        image = image[:, :, 0]
+    return image < image.mean()
+
+
+def ink_profiles(image):
+    """ Returns (rows, columns), the fraction of ink in each row and in each
+        column of the image.
+    """
+    ink = binarize(image)
+    (height, width) = ink.shape
+    return (ink.sum(axis=1) / float(width), ink.sum(axis=0) / float(height))
+
+
+def centroid(profile):
+    """ Returns the weighted mean position along the last axis of the
+        profile, scaled so the whole profile spans [0, 1). An empty profile
+        is centered at 0.5.
+    """
+    profile = numpy.asarray(profile, dtype=numpy.float64)
+    n = profile.shape[-1]
+    total = profile.sum(axis=-1)
+    loc = numpy.dot(profile, numpy.arange(n, dtype=numpy.float64))
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(total > 0, loc / total / n, 0.5)
+
+
+def spread(profile):
+    """ Returns the weighted standard deviation of the position along the
+        last axis of the profile, on the same scale as centroid.
+    """
+    profile = numpy.asarray(profile, dtype=numpy.float64)
+    n = profile.shape[-1]
+    total = profile.sum(axis=-1)
+    positions = numpy.arange(n, dtype=numpy.float64) / n
+    second = numpy.dot(profile, positions * positions)
+    mean = centroid(profile)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        variance = numpy.maximum(second / total - mean * mean, 0.0)
+        return numpy.where(total > 0, numpy.sqrt(variance), 0.0)
+
+
+def profile_features(image):
+    """ Returns the centroid and spread of the row profile followed by the
+        centroid and spread of the column profile of the image.
+    """
+    (rows, columns) = ink_profiles(image)
+    return numpy.array([centroid(rows), spread(rows),
+                        centroid(columns), spread(columns)])
+
+
+def batch_ink_profiles(images):
+    """ Returns (rows, columns) for a stack of same sized images, with the
+        profile of each image in a row of each array. Each image is
+        binarized against its own mean.
+    """
+    images = numpy.asarray(images)
+    if images.ndim == 4:
+        images = images[:, :, :, 0]
+    means = images.reshape((images.shape[0], -1)).mean(axis=1)
+    ink = images < means[:, numpy.newaxis, numpy.newaxis]
+    (height, width) = ink.shape[1:]
+    return (ink.sum(axis=2) / float(width), ink.sum(axis=1) / float(height))
+
+
+def batch_profile_features(images):
+    """ Returns the profile_features of each image in a stack of same sized
+        images, one image per row.
+    """
+    (rows, columns) = batch_ink_profiles(images)
+    return numpy.column_stack((centroid(rows), spread(rows),
+                               centroid(columns), spread(columns)))
@@ -3,225 +3,516 @@
 """ Main script to digitize sheet music """
 
 import clustering
-import json
-import numpy, scipy
-from scipy import ndimage
-from scipy import misc
-import random
+import cross_validation
+import feature_cache
+import fingerprints
+import hog
+import manifest
+import math
+import model_store
+import music_sheet
+import numpy
+import os
+import packed_dataset
+import pdf_pages
+import pipeline
+import profiles
+import seperate_staffs
+import sys
+import time
+
+# where extracted features are cached between runs, None to always decode
+FEATURE_CACHE_DIR = "cache/features"
+
+# the labeled images packed by packed_dataset.py, read instead of decoding
+# each image while the pack is newer than learn/learn.json
+PACKED_IMAGES = "learn/learn.pack"
 
 def mark_of_the_beast(image):
-    """ Returns the row sums of brightness of the image. """
-    features = numpy.array(0)
+    """ Returns the fraction of ink in each column of the image. """
+    return profiles.ink_profiles(image)[1]
 
-    image = ndimage.rotate(image, 90)
 
-    width = image.shape[0]
-    for row in (image < image.mean()).astype(numpy.float):
-        tmpSum = 0
-        for pixel in row:
-            tmpSum = tmpSum + pixel
-        features = numpy.append(features, tmpSum/width)
-
-    return features
+def mean_brightness(image):
+    """ Finds the average brightness of the image. """
+    return numpy.array([image.mean()])
 
 
 def center(image):
-    """ Finds the centeroid (geometric mean) """
-    row_brightness = mark_of_the_beast(image)
-    loc = 0.0
-    total_weight = 0.0
-    for i in range(len(row_brightness)):
-        loc = loc + i * row_brightness[i]
-        total_weight = total_weight + row_brightness[i]
-    return numpy.array([loc / total_weight / len(row_brightness)])
+    """ Finds the centeroid (geometric mean) of the ink across the columns """
+    return numpy.array([profiles.centroid(mark_of_the_beast(image))])
+
+
+def hog_features(image):
+    """ Finds the histogram of oriented gradients of the image, resampled to
+        a fixed size so every note gives the same features for the same cost.
+    """
+    return hog.hog(image, cell_size=16, shape=(32, 80))
+
+
+# the features the type and pitch classifiers are trained on
+TYPE_FEATURES = mean_brightness
+PITCH_FEATURES = center
+
+# the regularization every classifier is trained with, in cross validation
+# as well as for the saved models
+CLASSIFIER_REG = 1e-6
+
+# note types from a whole note down, each lasting half as long as the last
+NOTE_TYPES = [music_sheet.NoteType.FULL, music_sheet.NoteType.HALF,
+              music_sheet.NoteType.QUATER, music_sheet.NoteType.EIGHT,
+              music_sheet.NoteType.SIXTEEN, music_sheet.NoteType.THIRTY_SECOND,
+              music_sheet.NoteType.SIXTY_FOUR]
+
+# labeled pitches count steps up from the middle line of the staff
+PITCH_LETTERS = "CDEFGAB"
+MIDDLE_LINES = {"TREBLE": "B", "BASS": "D"}
+CLEFS = {"treble": music_sheet.Clef.TREBLE, "bass": music_sheet.Clef.BASS}
+
+# types the type classifier finds that are left out of the sheet
+SKIPPED_TYPES = ("ignore", "time")
+
+TRANSCRIBE_STAGES = ["models", "load", "segment", "features", "classify",
+                     "build", "save"]
 
 
 def get_type_classifier_subset(train_ratio, file_location, get_features):
     print("-- Training Type Classifier --")
-    file_data = open(file_location, 'r')
-    image_files = json.load(file_data)
+    labeled = manifest.load_manifest(file_location)
 
-    notes = []
-    # filter out anything that isn't a note
-    for image in image_files:
-        file_name = image.keys()[0]
-        data = image[file_name]
-        if data["type"] not in ["ignore", "time", "bar"]:
-            notes.append(image)
+    # hold out a share of each label to test on
+    candidates = numpy.arange(len(labeled))
+    (_, codes, _) = type_labels(labeled, candidates)
+    (train, test) = manifest.stratified_split(candidates, codes, 1.0 - train_ratio)
 
-    # separate out images to test on
-    test_images = []
-    for _ in range(int((1.0 - train_ratio) * len(notes))):
-        index = int(random.random() * len(notes))
-        test_images.append(notes.pop(index))
+    print("training on %i images" % len(train))
+    print("testing on %i images" % len(test))
 
-    print("training on %i images" % len(notes))
-    print("testing on %i images" % len(test_images))
+    (classer, label_map) = get_type_classifier(labeled, get_features, verbose=True,
+                                               indices=train)
 
-    (classer, label_map) = get_type_classifier(notes, get_features, verbose=True)
+    file_names = [ labeled.file_names[i] for i in test ]
+    expected_labels = [ type_label(labeled, i) for i in test ]
 
-    num_correct = 0
-    for image in test_images:
-        file_name = image.keys()[0]
-        data = image[file_name]
-        if data["type"] == "note":
-            expected_label = "note,{0}".format(data["length"])
-        elif data["type"] == "rest":
-            expected_label = "rest,{0}".format(data["length"])
-        else:
-            expected_label = data["type"]
-        features = get_features(misc.imread(file_name))
-        actual_label = label_map[classer(features)]
-        if actual_label == expected_label:
-            num_correct = num_correct + 1
-        else:
-            print("Features")
-            print(features)
-            print("Expected %s, got %s" % (expected_label, actual_label))
-
-    print("Accuracy %f (%i / %i)" % ((float(num_correct) / len(test_images)), num_correct, len(test_images)))
-
-
-def get_type_classifier(image_files, get_features, verbose=False):
-    """ Gets a classifier that can be used to find the type of a note. """
-    label_map = []
-    labels = []
-    file_names = []
-
-    # Iterating through each image that the algorithm can train on.
-    for image in image_files:
-        file_name = image.keys()[0]
-        data = image[file_name]
-        if data["type"] == "note":
-            label = "note,{0}".format(data["length"])
-        elif data["type"] == "rest":
-            label = "rest,{0}".format(data["length"])
-        elif data["type"] in ["ignore", "time", "bar"]:
-            continue
-        else:
-            label = data["type"]
+    num_correct = report_predictions(classer, label_map, file_names,
+                                     expected_labels, get_features)
 
-        # Add the label to the list if it is not already there,
-        # and record the index of the label in the list of valid labels
-        if label not in label_map:
-            label_map.append(label)
-            index = len(label_map) - 1
-        else:
-            index = label_map.index(label)
+    print("Accuracy %f (%i / %i)" % ((float(num_correct) / max(len(test), 1)), num_correct, len(test)))
 
-        # add the label for this image to the list of labels
-        labels.append(index)
-        file_names.append(file_name)
 
-    classer = train_classifier(file_names, labels, len(label_map), get_features, verbose)
+def get_type_classifier(labeled, get_features, verbose=False, model_path=None,
+                        indices=None):
+    """ Gets a classifier that can be used to find the type of a note, from
+        the images of a manifest.Manifest (the given indices of it, or every
+        image).
+        If model_path is given the classifier is loaded from there when it is
+        up to date, and saved there when it has to be retrained.
+    """
+    (file_names, labels, label_map) = type_labels(labeled, indices)
+    classer = load_or_train_classifier(model_path, file_names, labels, label_map,
+                                       get_features, verbose)
     if verbose:
         print("Label map:")
         print(label_map)
     return classer, label_map
 
 
-def get_pitch_classifier_subset(train_ratio, file_location, get_features):
-    print("-- Training Pitch Classifier --")
-    file_data = open(file_location, 'r')
-    image_files = json.load(file_data)
+def type_labels(labeled, indices=None):
+    """ Finds the type label of the images at the given indices of a
+        manifest.Manifest, by default every image. Returns (file_names,
+        labels, label_map) where labels holds the index of each image's
+        label in label_map.
+    """
+    if indices is None:
+        indices = numpy.arange(len(labeled))
+    encoder = manifest.LabelEncoder()
+    labels = encoder.encode_all(type_label(labeled, i) for i in indices)
+    file_names = [ labeled.file_names[i] for i in indices ]
+    return file_names, labels, encoder.classes
 
-    notes = []
-    # filter out anything that isn't a note
-    for image in image_files:
-        file_name = image.keys()[0]
-        data = image[file_name]
-        if data["type"] == "note":
-            notes.append(image)
 
-    # separate out images to test on
-    test_images = []
-    for i in range(int((1.0 - train_ratio) * len(notes))):
-        index = int(random.random() * len(notes))
-        test_images.append(notes.pop(index))
+def type_label(labeled, i):
+    """ Returns the label the type classifier gives the i-th image of a
+        manifest: the type, with the length for notes and rests.
+    """
+    type_name = labeled.types.decode(labeled.type_codes[i])
+    if type_name in ("note", "rest"):
+        return "{0},{1}".format(type_name, float(labeled.lengths[i]))
+    return type_name
 
-    print("training on %i images" % len(notes))
-    print("testing on %i images" % len(test_images))
 
-    (classer, label_map) = get_pitch_classifier(notes, get_features, verbose=True)
+def get_pitch_classifier_subset(train_ratio, file_location, get_features):
+    print("-- Training Pitch Classifier --")
+    labeled = manifest.load_manifest(file_location)
 
-    num_correct = 0
-    for image in test_images:
-        file_name = image.keys()[0]
-        data = image[file_name]
-        expected_label = data["pitch"]
-        features = get_features(misc.imread(file_name))
-        actual_label = label_map[classer(features)]
-        if actual_label == expected_label:
-            num_correct = num_correct + 1
-        else:
-            print("Features")
-            print(features)
-            print("Expected %s, got %s" % (expected_label, actual_label))
+    # hold out a share of each pitch to test on
+    notes = labeled.type_indices("note")
+    (_, codes, _) = pitch_labels(labeled, notes)
+    (train, test) = manifest.stratified_split(notes, codes, 1.0 - train_ratio)
 
-    print("Accuracy %f (%i / %i)" % ((float(num_correct) / len(test_images)), num_correct, len(test_images)))
+    print("training on %i images" % len(train))
+    print("testing on %i images" % len(test))
 
+    (classer, label_map) = get_pitch_classifier(labeled, get_features, verbose=True,
+                                                indices=train)
 
-def get_pitch_classifier(image_files, get_features, verbose=False):
-    """ Gets a classifier that can be used to find the pitch of a note. """
-    label_map = []
-    labels = []
-    file_names = []
+    file_names = [ labeled.file_names[i] for i in test ]
+    expected_labels = [ int(labeled.pitches[i]) for i in test ]
 
-    # Iterating through each image that the algorithm can train on.
-    for image in image_files:
-        file_name = image.keys()[0]
-        data = image[file_name]
-        if data["type"] == "note":
-            label = data["pitch"]
-        else:
-            continue
+    num_correct = report_predictions(classer, label_map, file_names,
+                                     expected_labels, get_features)
 
-        # Add the label to the list if it is not already there,
-        # and record the index of the label in the list of valid labels
-        if label not in label_map:
-            label_map.append(label)
-            index = len(label_map) - 1
-        else:
-            index = label_map.index(label)
+    print("Accuracy %f (%i / %i)" % ((float(num_correct) / max(len(test), 1)), num_correct, len(test)))
 
-        # add the label for this image to the list of labels
-        labels.append(index)
-        file_names.append(file_name)
 
-    classer = train_classifier(file_names, labels, len(label_map), get_features, verbose)
+def get_pitch_classifier(labeled, get_features, verbose=False, model_path=None,
+                         indices=None):
+    """ Gets a classifier that can be used to find the pitch of a note, from
+        the images of a manifest.Manifest (the given indices of it, or every
+        note).
+        If model_path is given the classifier is loaded from there when it is
+        up to date, and saved there when it has to be retrained.
+    """
+    (file_names, labels, label_map) = pitch_labels(labeled, indices)
+    classer = load_or_train_classifier(model_path, file_names, labels, label_map,
+                                       get_features, verbose)
     if verbose:
         print("Label map:")
         print(label_map)
     return classer, label_map
 
 
+def pitch_labels(labeled, indices=None):
+    """ Finds the pitch label of the notes at the given indices of a
+        manifest.Manifest, by default every note. Returns (file_names,
+        labels, label_map) where labels holds the index of each image's
+        label in label_map.
+    """
+    if indices is None:
+        indices = labeled.type_indices("note")
+    encoder = manifest.LabelEncoder()
+    labels = encoder.encode_all(int(labeled.pitches[i]) for i in indices)
+    file_names = [ labeled.file_names[i] for i in indices ]
+    return file_names, labels, encoder.classes
+
+
+def cross_validate_classifier(name, file_location, find_labels, get_features,
+                              k=5, seed=None):
+    """ Runs stratified k-fold cross validation of a classifier, with the
+        features of every image extracted once up front. find_labels is
+        type_labels or pitch_labels. Prints a summary and returns the results
+        of cross_validation.cross_validate.
+    """
+    (file_names, labels, label_map) = find_labels(manifest.load_manifest(file_location))
+    features = extract_features(file_names, get_features)
+
+    results = cross_validation.cross_validate(features, labels, len(label_map),
+                                              k, seed, reg=CLASSIFIER_REG)
+
+    print("-- Cross Validating %s Classifier --" % name)
+    print("Accuracy %f over %i images in %i folds" % (results["accuracy"], len(labels), k))
+    for fold in range(k):
+        print("fold %i: accuracy %f in %.3fs" % (fold, results["fold_accuracy"][fold],
+                                                 results["fold_seconds"][fold]))
+    print("Confusion matrix (rows expected, columns predicted):")
+    print(label_map)
+    print(results["confusion"])
+    return results
+
+
+def load_or_train_classifier(model_path, image_files, labels, label_map,
+                             get_features, verbose=False):
+    """ Loads the classifier saved at model_path if it was trained on the same
+        images and labels with the same feature extractor. Otherwise trains a
+        new one and saves it there. With no model_path it always trains.
+    """
+    if model_path is None:
+        return train_classifier(image_files, labels, len(label_map), get_features, verbose)
+
+    extractor = fingerprints.extractor_identity(get_features)
+    manifest = fingerprints.manifest_hash(image_files, [ label_map[l] for l in labels ])
+    saved = model_store.load_if_current(model_path, extractor, manifest,
+                                        CLASSIFIER_REG)
+    if saved is not None:
+        if verbose:
+            print("Loaded classifier from %s" % model_path)
+        return saved[0]
+
+    classer = train_classifier(image_files, labels, len(label_map), get_features, verbose)
+    model_store.save_model(model_path, classer, label_map, extractor, manifest,
+                           CLASSIFIER_REG)
+    return classer
+
+
+def load_classifiers(file_location, model_dir="models"):
+    """ Gets the type and pitch classifiers trained on every labeled image,
+        reusing the models saved in model_dir while they are up to date.
+
+        Returns ((type_classer, type_label_map), (pitch_classer, pitch_label_map)).
+    """
+    if not os.path.isdir(model_dir):
+        os.makedirs(model_dir)
+    labeled = manifest.load_manifest(file_location)
+
+    type_classifier = get_type_classifier(
+        labeled, TYPE_FEATURES, model_path=os.path.join(model_dir, "type.npz"))
+    pitch_classifier = get_pitch_classifier(
+        labeled, PITCH_FEATURES, model_path=os.path.join(model_dir, "pitch.npz"))
+    return type_classifier, pitch_classifier
+
+
 def train_classifier(image_files, labels, m, get_features, verbose=False):
-    """ Trains a classifier using the given images files and labels.
+    """ Trains a classifier using the given images files and labels, with
+        CLASSIFIER_REG added to each class covariance.
         Uses the given function to extract a feature vector from the image file.
     """
-    features = []
-    for file_name in image_files:
-        image = misc.imread(file_name)
-        features.append(get_features(image))
-
     # stack the data correctly
-    features = numpy.vstack(features).T
+    features = extract_features(image_files, get_features)
 
     # get the classifier
-    (classer, phi, mu, sig) = clustering.gda(features, labels, m)
+    classer = clustering.gda(features, labels, m, CLASSIFIER_REG)
     if verbose:
         print("Data:")
         print(features)
         print("phi:")
-        print(phi)
+        print(classer.phi)
         print("mu:")
-        print(mu)
+        print(classer.mu)
         print("sigma:")
-        print(sig)
+        print(classer.sig)
     return classer
 
 
+def extract_features(file_names, get_features, cache_dir=FEATURE_CACHE_DIR,
+                     processes=None):
+    """ Returns the features of each image file in a column, reading them
+        from the feature cache in cache_dir where possible. With no cache_dir
+        every image is loaded. Images are loaded with image_loader and
+        featurized across processes workers, all cores by default.
+    """
+    load_image = image_loader()
+    if cache_dir is None:
+        return pipeline.featurize(file_names, get_features, processes,
+                                  load_image=load_image).T
+
+    cache = feature_cache.FeatureCache(get_features, cache_dir,
+                                       load_image=load_image)
+    return cache.features(file_names, processes).T
+
+
+def image_loader(file_location="learn/learn.json", packed=PACKED_IMAGES):
+    """ Returns the function the labeled images are loaded with: reading
+        them from the grayscale pack at packed while it is newer than the
+        manifest at file_location, or None to decode each image file.
+    """
+    dataset = packed_dataset.open_current(packed, file_location)
+    if dataset is None or dataset.bits:
+        return None
+    return dataset.load_image
+
+
+def report_predictions(classer, label_map, file_names, expected_labels,
+                       get_features):
+    """ Classifies all of the given image files in one batch, prints the
+        misclassified ones, and returns the number classified correctly.
+    """
+    if not file_names:
+        return 0
+    features = extract_features(file_names, get_features)
+    predicted = classer.predict(features)
+
+    num_correct = 0
+    for i in range(len(file_names)):
+        actual_label = label_map[predicted[i]]
+        if actual_label == expected_labels[i]:
+            num_correct = num_correct + 1
+        else:
+            print("Features")
+            print(features[:, i])
+            print("Expected %s, got %s" % (expected_labels[i], actual_label))
+    return num_correct
+
+
+def transcribe(page_files, output, classifiers=None, title=None,
+               verbose=False, components=False):
+    """ Transcribes the pages of a score, in order, into a .sm file. Each
+        of page_files is an image of a page or a PDF of any number of pages.
+
+        Each page is split into staffs and glyphs, every glyph on the page is
+        classified by type in one batch and every note by pitch in another,
+        and the notes and rests are written to the MusicSheet saved to
+        output, with a new measure at each bar line.
+        classifiers is the result of load_classifiers, which is called when
+        it is not given. components is passed on to segment_page.
+
+        Returns (sheet, timings) where timings maps each of the
+        TRANSCRIBE_STAGES to the seconds spent in it.
+    """
+    timings = dict((stage, 0.0) for stage in TRANSCRIBE_STAGES)
+    started = time.time()
+    if classifiers is None:
+        classifiers = load_classifiers("learn/learn.json")
+    started = _lap(timings, "models", started)
+
+    staffs = []
+    num_pages = 0
+    for page_file in page_files:
+        # a PDF is rasterized a page at a time as the loop asks for it
+        for page in pdf_pages.load_pages(page_file):
+            started = _lap(timings, "load", started)
+            num_pages += 1
+
+            page_staffs = segment_page(page, components)
+            glyphs = [ glyph for staff in page_staffs for glyph in staff ]
+            started = _lap(timings, "segment", started)
+
+            (labels, pitches) = classify_glyphs(glyphs, classifiers, timings)
+            started = time.time()
+
+            # split the labels back up by staff
+            for staff in page_staffs:
+                staffs.append((labels[:len(staff)], pitches[:len(staff)]))
+                (labels, pitches) = (labels[len(staff):], pitches[len(staff):])
+
+    sheet = build_sheet(staffs, title)
+    started = _lap(timings, "build", started)
+
+    sheet.save_file(output)
+    _lap(timings, "save", started)
+
+    if verbose:
+        print("Transcribed %i staffs from %i pages into %s" %
+              (len(staffs), num_pages, output))
+        for stage in TRANSCRIBE_STAGES:
+            print("%-9s %.4fs" % (stage, timings[stage]))
+    return sheet, timings
+
+
+def segment_page(page, components=False):
+    """ Splits a page into the glyphs on each of its staffs. Each glyph is
+        turned on its side and binarized to 0 or 255, the way learn.py saved
+        the labeled images. The page is read a strip at a time, so a
+        memory mapped page is never binarized whole.
+
+        Glyphs are split where the whitespace between columns rises, or with
+        components by the columns of the connected components of ink found
+        by seperate_staffs.glyph_boxes. Either way each glyph spans the
+        height of its staff, like the labeled images.
+
+        Returns a list with the list of glyphs on each staff, left to right.
+    """
+    staffs = []
+    for staff in seperate_staffs.tiled_seperate_staffs(page):
+        turned = numpy.rot90(staff, -1)
+        if components:
+            columns = [ box[1] for box in seperate_staffs.glyph_boxes(staff) ]
+            (starts, stops) = ([ c.start for c in columns ],
+                               [ c.stop for c in columns ])
+        else:
+            (starts, stops) = seperate_staffs.note_bounds(staff)
+        staffs.append([ turned[start:stop] * 255.0 \
+                        for (start, stop) in zip(starts, stops) ])
+    return staffs
+
+
+def classify_glyphs(glyphs, classifiers, timings=None):
+    """ Finds the type label of every glyph, and the pitch of every glyph
+        labeled as a note, in one batch per classifier.
+
+        Returns (labels, pitches) where pitches is None for anything that is
+        not a note. When timings is given the seconds spent extracting
+        features and classifying are added to it.
+    """
+    ((type_classer, type_map), (pitch_classer, pitch_map)) = classifiers
+    if timings is None:
+        timings = dict((stage, 0.0) for stage in TRANSCRIBE_STAGES)
+    if not glyphs:
+        return [], []
+
+    started = time.time()
+    features = _feature_matrix(glyphs, TYPE_FEATURES)
+    started = _lap(timings, "features", started)
+    labels = [ type_map[i] for i in type_classer.predict(features) ]
+    started = _lap(timings, "classify", started)
+
+    notes = [ i for (i, label) in enumerate(labels) if label.startswith("note,") ]
+    pitches = [ None ] * len(glyphs)
+    if notes:
+        features = _feature_matrix([ glyphs[i] for i in notes ], PITCH_FEATURES)
+        started = _lap(timings, "features", started)
+        for (i, index) in zip(notes, pitch_classer.predict(features)):
+            pitches[i] = pitch_map[index]
+        _lap(timings, "classify", started)
+    return labels, pitches
+
+
+def build_sheet(staffs, title=None):
+    """ Builds a MusicSheet from the (labels, pitches) of each staff, in
+        order. A bar starts a new measure unless the current one is still
+        empty, and the first clef found sets the clef of the sheet. Anything
+        labeled as one of the SKIPPED_TYPES is left out.
+    """
+    sheet = music_sheet.MusicSheet(None)
+    if title is not None:
+        sheet.assign_title(title)
+    sheet.create_measure()
+
+    found_clef = False
+    for (labels, pitches) in staffs:
+        for (label, pitch) in zip(labels, pitches):
+            if label in SKIPPED_TYPES:
+                continue
+            elif label == "bar":
+                if sheet.get_measures()[-1].notes:
+                    sheet.create_measure()
+            elif label in CLEFS:
+                if not found_clef:
+                    sheet.assign_clef(CLEFS[label])
+                    found_clef = True
+            elif label.startswith("note,"):
+                sheet.add_note_to_measure(note_type(float(label.split(",")[1])),
+                                          pitch_name(pitch, sheet.get_clef()),
+                                          music_sheet.Accidentals.NONE)
+            elif label.startswith("rest,"):
+                sheet.add_note_to_measure(note_type(float(label.split(",")[1])),
+                                          "Rest", music_sheet.Accidentals.NONE)
+    return sheet
+
+
+def note_type(length):
+    """ Finds the NoteType of a note lasting length whole notes. """
+    if length <= 0:
+        raise ValueError("note length must be positive, got %r" % length)
+    steps = int(round(-math.log(length, 2)))
+    return NOTE_TYPES[min(max(steps, 0), len(NOTE_TYPES) - 1)]
+
+
+def pitch_name(pitch, clef):
+    """ Finds the letter of a note pitch steps above the middle line of a
+        staff with the given clef.
+    """
+    middle = PITCH_LETTERS.index(MIDDLE_LINES.get(clef.name, "B"))
+    return PITCH_LETTERS[(middle + int(pitch)) % len(PITCH_LETTERS)]
+
+
+def _feature_matrix(images, get_features):
+    """ Returns the features of each image in a column. """
+    return numpy.column_stack([ numpy.ravel(get_features(image)) \
+                                for image in images ])
+
+
+def _lap(timings, stage, started):
+    """ Adds the time since started to the stage and returns the time now. """
+    now = time.time()
+    timings[stage] += now - started
+    return now
+
+
 if __name__ == "__main__":
-    train_ratio = .9
-    get_type_classifier_subset(train_ratio, "learn/learn.json", lambda img: numpy.array([img.mean()]))
-    get_pitch_classifier_subset(train_ratio, "learn/learn.json", center)
+    if len(sys.argv) > 3 and sys.argv[1] == "transcribe":
+        pages = [ arg for arg in sys.argv[3:] if arg != "--components" ]
+        transcribe(pages, sys.argv[2], verbose=True,
+                   components="--components" in sys.argv[3:])
+    else:
+        cross_validate_classifier("Type", "learn/learn.json", type_labels, mean_brightness)
+        cross_validate_classifier("Pitch", "learn/learn.json", pitch_labels, center)
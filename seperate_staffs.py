@@ -1,91 +1,281 @@
 #!/usr/bin/env python
-from scipy import ndimage
 from scipy import misc
-import matplotlib.pyplot as plt
+from scipy import ndimage
 import numpy
 import sys
 
-import json
+import profiles
 
-def seperate_staffs(image):
+#Finds the whitespace of an image: every pixel brighter than the mean, as a
+#boolean array (color images are read from their first channel)
+def whitespace(image):
+    return ~profiles.binarize(image)
 
-    #filter out any small noise and force any gray in the image to be
-    #pure black or white depending if it is above or below the mean of the image
-    image = (image > image.mean()).astype(numpy.float)
-    threshold = image.shape[1] - 5
+#Finds the rows of each staff in a page, where a staff is a run of rows with
+#fewer than width - margin white pixels. Runs that are mostly whitespace,
+#like titles and lyrics, are dropped: a staff must be darker than the
+#average run.
+#image - the page, or its whitespace mask
+#plot - show the whitespace profile and threshold with matplotlib
+#returns (starts, stops), the first row of each staff and the row after it
+def staff_bounds(image, margin=5, plot=False):
+    white = image if image.dtype == bool else whitespace(image)
+    return _staff_runs(white.sum(axis=1), white.shape[1], margin, plot)
 
-    #count up the whitespace in each row
-    whitespace_counts = []
-    for i in image:
-        whitespace_sum = 0
-        for j in i:
-            whitespace_sum = whitespace_sum + j
-        whitespace_counts.append(whitespace_sum[0])
+#Finds the staffs of a page without binarizing all of it at once, reading
+#tile_rows rows at a time: one pass finds the mean brightness and a second
+#counts the whitespace in each row. Only a strip of the page and a count per
+#row are held in memory, and since the runs are found in the finished
+#profile a staff that crosses the edge of a strip is found whole.
+#page - a 2D (or color) array that reads rows as it is sliced, like a
+#       numpy.memmap or numpy.load(file, mmap_mode='r')
+#returns (starts, stops) as staff_bounds does
+def tiled_staff_bounds(page, tile_rows=512, margin=5, plot=False):
+    (_, counts) = _tiled_profile(page, tile_rows)
+    return _staff_runs(counts, page.shape[1], margin, plot)
 
-    plt.plot(whitespace_counts)
-    plt.plot([threshold for x in range(1, image.shape[0])])
-    plt.title("Horizontal Sumations for Sample Sheet Music")
-    plt.xlabel("Row number")
-    plt.ylabel("Horizontal Summation of Whitespace")
-    plt.show()
+#Splits a page into the whitespace masks of its staffs as seperate_staffs
+#does, but reads it a strip at a time with tiled_staff_bounds and only
+#binarizes the rows of the staffs at the end
+#returns a list of masks, one per staff
+def tiled_seperate_staffs(page, tile_rows=512, margin=5, plot=False):
+    (mean, counts) = _tiled_profile(page, tile_rows)
+    (starts, stops) = _staff_runs(counts, page.shape[1], margin, plot)
+    return [ _first_channel(page[start:stop]) >= mean \
+             for (start, stop) in zip(starts, stops) ]
 
-    #split the image based on whitespace
-    in_image = False
-    images = []
-    row_number = 0
-    for row in whitespace_counts:
-        if in_image:
-            if row > threshold:
-                in_image = False
-                images[-1] = (images[-1][0], row_number)
-        else:
-            if row < threshold:
-                in_image = True
-                images.append((row_number, 0))
-        row_number = row_number + 1
-
-    seperated_images = [image[x[0]:x[1], :] for x in images]
-    staff_threshold = sum([x.mean() for x in seperated_images])/len(seperated_images)
-    filtered_images = [x for x in seperated_images if x.mean() < staff_threshold]
-    return filtered_images
-
-
-def seperate_notes(image):
-    #filter out any small noise and force any gray in the image to be
-    #pure black or white depending if it is above or below the mean of the image
-    image = (image > image.mean()).astype(numpy.float)
-    #count up the whitespace in each row
-    whitespace_counts = []
-    for i in image:
-        whitespace_sum = 0
-        for j in i:
-            whitespace_sum = whitespace_sum + j
-        whitespace_counts.append(whitespace_sum[0])
-
-
-    threshold = numpy.median(whitespace_counts) - 1
-
-    plt.plot(whitespace_counts)
-    plt.plot([threshold for x in range(1, image.shape[0])])
-    plt.show()
+#Finds the staffs in the whitespace count of each row of a page width pixels
+#wide
+def _staff_runs(counts, width, margin, plot):
+    threshold = width - margin
+
+    if plot:
+        _plot_profile(counts, threshold,
+                      "Horizontal Sumations for Sample Sheet Music",
+                      "Row number", "Horizontal Summation of Whitespace")
+
+    #a staff starts on a row below the threshold and ends on the next row
+    #above it, rows right on the threshold do not change anything
+    (starts, stops) = _hysteresis_runs(counts < threshold, counts > threshold)
+    if len(starts) == 0:
+        return starts, stops
+
+    #keep the runs darker than the average run
+    totals = numpy.concatenate(([0], numpy.cumsum(counts)))
+    means = (totals[stops] - totals[starts]) / \
+        ((stops - starts) * float(width))
+    keep = means < means.mean()
+    return starts[keep], stops[keep]
+
+#Finds the columns of each note in a staff, where a note is a run of columns
+#with no more white pixels than one less than the median column
+#staff - an upright staff, or its whitespace mask
+#plot - show the whitespace profile and threshold with matplotlib
+#returns (starts, stops), the first column of each note and the column after
+def note_bounds(staff, plot=False):
+    white = staff if staff.dtype == bool else whitespace(staff)
+    return _note_runs(white.sum(axis=0), plot)
+
+#Finds the staff lines in a staff from the vertical runs of ink in each
+#column. The most common ink run is the thickness of a line and the most
+#common gap between ink runs is the space between lines. Rows where more
+#than line_fraction of the width is covered by runs no longer than a line
+#are lines, and lines further apart than one and a half line periods start
+#a new set, so a grand staff gives two sets of five.
+#staff - an upright staff, or its whitespace mask
+#returns (lines, thickness, spacing) where lines is a list with an array of
+#the line centers (in rows) of each set of lines, top to bottom
+def staff_lines(staff, line_fraction=0.5):
+    white = staff if staff.dtype == bool else whitespace(staff)
+    ink = ~white
+    (columns, starts, stops) = _column_runs(ink)
+    if len(starts) == 0:
+        return [], 0, 0
+    lengths = stops - starts
+
+    thickness = int(numpy.argmax(numpy.bincount(lengths)))
+    same_column = columns[1:] == columns[:-1]
+    gaps = (starts[1:] - stops[:-1])[same_column]
+    spacing = int(numpy.argmax(numpy.bincount(gaps))) if len(gaps) else 0
+
+    #count the ink in each row that belongs to runs as thin as a line
+    thin = lengths <= _max_line_run(thickness)
+    rows = numpy.zeros(ink.shape[0] + 1, dtype=numpy.int64)
+    numpy.add.at(rows, starts[thin], 1)
+    numpy.add.at(rows, stops[thin], -1)
+    thin_ink = numpy.cumsum(rows)[:-1]
+
+    (line_starts, line_stops) = _runs(thin_ink > line_fraction * ink.shape[1])
+    centers = (line_starts + line_stops - 1) / 2.0
+    if len(centers) == 0:
+        return [], thickness, spacing
+
+    breaks = numpy.flatnonzero(numpy.diff(centers) > 1.5 * (thickness + spacing))
+    return numpy.split(centers, breaks + 1), thickness, spacing
+
+#Erases staff lines from an ink mask in place: every vertical run of ink no
+#longer than a line that touches one of the lines is cleared, so glyphs that
+#cross a line keep their pixels there
+#ink - a boolean mask that is true on ink
+#lines, thickness - as returned by staff_lines
+#returns the ink mask
+def remove_staff_lines(ink, lines, thickness):
+    if len(lines) == 0:
+        return ink
+    centers = numpy.concatenate(lines)
+    on_line = numpy.zeros(ink.shape[0] + 1, dtype=numpy.int64)
+    tops = numpy.clip(numpy.floor(centers - thickness / 2.0).astype(numpy.intp),
+                      0, ink.shape[0])
+    bottoms = numpy.clip(numpy.ceil(centers + thickness / 2.0).astype(numpy.intp) + 1,
+                         0, ink.shape[0])
+    numpy.add.at(on_line, tops, 1)
+    numpy.add.at(on_line, bottoms, -1)
+    touched = numpy.concatenate(([0], numpy.cumsum(numpy.cumsum(on_line)[:-1] > 0)))
+
+    (columns, starts, stops) = _column_runs(ink)
+    erase = (stops - starts <= _max_line_run(thickness)) & \
+        (touched[stops] > touched[starts])
+    (columns, starts, stops) = (columns[erase], starts[erase], stops[erase])
+
+    #spell out the rows of every run to erase
+    lengths = stops - starts
+    offsets = numpy.arange(lengths.sum()) - \
+        numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+    ink[numpy.repeat(starts, lengths) + offsets, numpy.repeat(columns, lengths)] = False
+    return ink
 
-    #split the image based on whitespace
-    in_image = False
-    images = []
-    row_number = 0
-    for row in whitespace_counts:
-        if in_image:
-            if row > threshold:
-                in_image = False
-                images[-1] = (images[-1][0], row_number)
-        else:
-            if row <= threshold:
-                in_image = True
-                images.append((row_number, 0))
-        row_number = row_number + 1
-
-    seperated_images = [image[x[0]:x[1], :] for x in images]
-    return seperated_images
+#Finds the glyphs in a staff as connected components of ink instead of runs
+#of dark columns. Staff lines are erased first so they do not join every
+#glyph on the staff, then components smaller than min_area pixels are
+#dropped as noise and components whose columns overlap are merged, so a
+#note keeps its stem, flag and dots while neighbouring notes stay apart.
+#staff - an upright staff, or its whitespace mask
+#lines - the result of staff_lines for the staff, found when not given
+#returns a list of (rows, columns) slices, one box per glyph, left to right
+def glyph_boxes(staff, min_area=10, lines=None):
+    white = staff if staff.dtype == bool else whitespace(staff)
+    if lines is None:
+        lines = staff_lines(white)
+    ink = remove_staff_lines(~white, lines[0], lines[1])
+
+    (labels, count) = ndimage.label(ink, structure=numpy.ones((3, 3)))
+    if count == 0:
+        return []
+    boxes = ndimage.find_objects(labels)
+    areas = numpy.bincount(labels.ravel(), minlength=count + 1)[1:]
+
+    bounds = numpy.array([ (rows.start, rows.stop, columns.start, columns.stop) \
+                           for (rows, columns) in boxes ], dtype=numpy.intp)
+    bounds = bounds[areas >= min_area]
+    if len(bounds) == 0:
+        return []
+
+    #sweep the boxes from left to right, starting a new glyph wherever a box
+    #starts past the right edge of everything before it
+    bounds = bounds[numpy.argsort(bounds[:, 2], kind='mergesort')]
+    reach = numpy.maximum.accumulate(bounds[:, 3])
+    firsts = numpy.flatnonzero(numpy.concatenate(([True],
+                                                  bounds[1:, 2] >= reach[:-1])))
+    tops = numpy.minimum.reduceat(bounds[:, 0], firsts)
+    bottoms = numpy.maximum.reduceat(bounds[:, 1], firsts)
+    lefts = bounds[firsts, 2]
+    rights = reach[numpy.concatenate((firsts[1:] - 1, [len(bounds) - 1]))]
+    return [ (slice(int(top), int(bottom)), slice(int(left), int(right))) \
+             for (top, bottom, left, right) in zip(tops, bottoms, lefts, rights) ]
+
+#Splits a page into the whitespace masks of its staffs
+#returns a list of views into the mask, one per staff
+def seperate_staffs(image, plot=False):
+    white = whitespace(image)
+    (starts, stops) = staff_bounds(white, plot=plot)
+    return [ white[start:stop, :] for (start, stop) in zip(starts, stops) ]
+
+#Splits a staff turned to run down the page (as learn.py rotates them) into
+#the whitespace masks of its notes, top to bottom
+#returns a list of views into the mask, one per note
+def seperate_notes(image, plot=False):
+    white = whitespace(image)
+    (starts, stops) = _note_runs(white.sum(axis=1), plot)
+    return [ white[start:stop, :] for (start, stop) in zip(starts, stops) ]
+
+#Finds the mean brightness of a page and the whitespace in each of its rows,
+#reading tile_rows rows at a time. Pixels are white when they are no darker
+#than the mean, as in whitespace.
+def _tiled_profile(page, tile_rows):
+    if tile_rows < 1:
+        raise ValueError("tile_rows must be positive, got %r" % tile_rows)
+    height = page.shape[0]
+    total = 0.0
+    for top in range(0, height, tile_rows):
+        total += _first_channel(page[top:top + tile_rows]).sum(dtype=numpy.float64)
+    mean = total / (height * page.shape[1])
+
+    counts = numpy.empty(height, dtype=numpy.int64)
+    for top in range(0, height, tile_rows):
+        strip = _first_channel(page[top:top + tile_rows])
+        counts[top:top + len(strip)] = (strip >= mean).sum(axis=1)
+    return mean, counts
+
+#Reads a color image from its first channel, as profiles.binarize does
+def _first_channel(image):
+    image = numpy.asarray(image)
+    return image[:, :, 0] if image.ndim == 3 else image
+
+#Run length encodes the ink in each column of a mask
+#returns (columns, starts, stops) of every run, ordered by column then row
+def _column_runs(ink):
+    (height, width) = ink.shape
+    padded = numpy.zeros((width, height + 2), dtype=numpy.int8)
+    padded[:, 1:-1] = ink.T
+    edges = numpy.diff(padded, axis=1)
+    (columns, starts) = numpy.nonzero(edges == 1)
+    stops = numpy.nonzero(edges == -1)[1]
+    return columns, starts, stops
+
+#The longest vertical run of ink taken to be part of a line of the given
+#thickness rather than a glyph crossing it, with at least two pixels of slack
+#so a thin line that binarizes a little thicker in places still counts
+def _max_line_run(thickness):
+    return thickness + max(2, thickness)
+
+def _note_runs(counts, plot):
+    threshold = numpy.median(counts) - 1
+    if plot:
+        _plot_profile(counts, threshold, "Whitespace Across a Staff",
+                      "Position", "Summation of Whitespace")
+    return _runs(counts <= threshold)
+
+#Finds the runs of true values in a boolean array
+#returns (starts, stops) as index arrays
+def _runs(inside):
+    edges = numpy.diff(numpy.concatenate(([0], inside.astype(numpy.int8), [0])))
+    return numpy.flatnonzero(edges == 1), numpy.flatnonzero(edges == -1)
+
+#Finds the runs that begin at an enter position and last until the next
+#leave position, positions that are neither keep the state they follow
+def _hysteresis_runs(enter, leave):
+    marked = numpy.where(enter | leave, numpy.arange(len(enter)), -1)
+    last = numpy.maximum.accumulate(marked)
+    inside = (last >= 0) & enter[numpy.maximum(last, 0)]
+    return _runs(inside)
+
+def _plot_profile(counts, threshold, title, xlabel, ylabel):
+    import matplotlib.pyplot as plt
+
+    plt.plot(counts)
+    plt.plot([threshold] * len(counts))
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.show()
 
 if __name__ == "__main__":
-    print "do not run this file yet"
+    assert len(sys.argv) > 1, "Usage: <image> [--plot]"
+    page = misc.imread(sys.argv[1])
+    show = "--plot" in sys.argv[2:]
+    white = whitespace(page)
+    for (top, bottom) in zip(*staff_bounds(white, plot=show)):
+        (lefts, rights) = note_bounds(white[top:bottom], plot=show)
+        (lines, thickness, spacing) = staff_lines(white[top:bottom])
+        print("staff rows %i-%i: %i notes, %i sets of lines %i thick %i apart" %
+              (top, bottom, len(lefts), len(lines), thickness, spacing))
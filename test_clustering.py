@@ -13,6 +13,7 @@ import matplotlib.pyplot as mpl
 import itertools
 
 import clustering
+import instrumentation
 
 
 def zdist(d):
@@ -96,7 +97,8 @@ def run_em_test():
 
     classes = m
     input_data = numpy.concatenate(data, axis=1)
-    (w, _, mu, sig) = clustering.em(input_data, classes, 40, 0.01)
+    (w, _, mu, sig) = clustering.em(input_data, classes, 40, 0.01,
+                                    callback=instrumentation.print_reporter)
 
     out_labels = [ int(numpy.argmax(w[:, i])) \
                    for i in range(input_data.shape[1]) ]
@@ -214,9 +216,10 @@ def run_gda_test():
         data[:, index] = tmp
         labels[index] = tmp_l
 
-    (classer, phi, mu, sig) = clustering.gda(data, labels, m)
+    model = clustering.gda(data, labels, m)
+    (mu, sig) = (model.mu, model.sig)
 
-    out_labels = [ classer(numpy.asarray(data)[:, i]) for i in range(n) ]
+    out_labels = list(model.predict(data))
 
     outplot = fig.add_subplot(1, 2, 2)
 
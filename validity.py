@@ -0,0 +1,178 @@
+""" Contains measures of how well a set of clusters fits the data.
+
+    As in clustering, data is an array with a single data point in each
+    column, labels holds the cluster of each column in [0, m), and mu holds
+    the mean of each cluster in a column.
+"""
+
+# pylint: disable=C0103
+
+import numpy
+from scipy import spatial
+
+def dunn_index(data, labels, mu, chunk_size=1024):
+    """ Computes the Dunn index for the given set of clusters: the smallest
+        distance between any two means over the largest distance between any
+        two points in the same cluster.
+
+        The pairwise distances are computed chunk_size rows at a time, so
+        memory stays bounded no matter how large the clusters are.
+    """
+    mu = numpy.asarray(mu, dtype=numpy.float64)
+
+    # find min distance between any two means
+    mean_dists = _sq_distances(mu.T, mu.T)
+    mean_dists[numpy.diag_indices_from(mean_dists)] = numpy.inf
+    min_dist = numpy.sqrt(max(mean_dists.min(), 0.0))
+
+    # find max distance between any two data points in the same cluster
+    max_dist = cluster_diameters(data, labels, mu.shape[1], chunk_size).max()
+
+    if max_dist == 0:
+        return float("inf")
+    return float(min_dist / max_dist)
+
+
+def cluster_diameters(data, labels, m, chunk_size=1024):
+    """ Returns the largest distance between two points of each of the m
+        clusters.
+    """
+    points = numpy.asarray(data, dtype=numpy.float64).T
+    labels = numpy.asarray(labels, dtype=numpy.intp)
+
+    # group data in to classes with one sort instead of a pass per class
+    order = numpy.argsort(labels, kind='mergesort')
+    bounds = numpy.searchsorted(labels[order], numpy.arange(m + 1))
+
+    diameters = numpy.zeros(m)
+    for i in range(m):
+        members = points[order[bounds[i]:bounds[i + 1]]]
+        diameters[i] = diameter(members, chunk_size)
+    return diameters
+
+
+def diameter(points, chunk_size=1024):
+    """ Returns the largest distance between any two rows of points.
+
+        Only points that could still be part of the farthest pair are
+        compared: the hull vertices in two or three dimensions, and otherwise
+        the points far enough from the centroid to beat the pair found by a
+        double sweep.
+    """
+    if len(points) < 2:
+        return 0.0
+
+    dim = points.shape[1]
+    if dim == 1:
+        return float(points.max() - points.min())
+    if dim <= 3 and len(points) > dim + 1:
+        try:
+            hull = spatial.ConvexHull(points)
+            points = points[hull.vertices]
+        except spatial.QhullError:
+            # flat clusters have no hull, fall through to the pruning below
+            pass
+
+    # any pair of points found so far bounds the diameter from below
+    start = numpy.argmax(_sq_distances(points[:1], points)[0])
+    far = _sq_distances(points[start:start + 1], points)[0]
+    lower = far.max()
+
+    # d(x, y) <= |x - c| + |y - c|, so a point is only a candidate when it
+    # is far enough from the centroid c to beat the lower bound
+    radius = numpy.sqrt(_sq_distances(points.mean(axis=0)[numpy.newaxis],
+                                      points)[0])
+    candidates = points[radius + radius.max() >= numpy.sqrt(lower)]
+
+    return float(numpy.sqrt(max(lower,
+                                _max_sq_distance(candidates, chunk_size))))
+
+
+def davies_bouldin(data, labels, mu):
+    """ Computes the Davies-Bouldin index, the average over the clusters of
+        the worst ratio of spread to separation with any other cluster.
+        Lower is better.
+    """
+    points = numpy.asarray(data, dtype=numpy.float64).T
+    labels = numpy.asarray(labels, dtype=numpy.intp)
+    centers = numpy.asarray(mu, dtype=numpy.float64).T
+    m = len(centers)
+
+    # the mean distance from the points in each cluster to the cluster mean
+    to_center = numpy.sqrt(((points - centers[labels]) ** 2).sum(axis=1))
+    counts = numpy.bincount(labels, minlength=m)
+    spread = numpy.bincount(labels, weights=to_center, minlength=m) / \
+        numpy.maximum(counts, 1)
+
+    separation = numpy.sqrt(numpy.maximum(_sq_distances(centers, centers),
+                                          0.0))
+    separation[numpy.diag_indices(m)] = numpy.inf
+    ratios = (spread[:, numpy.newaxis] + spread) / separation
+    return float(ratios.max(axis=1).mean())
+
+
+def silhouette(data, labels, sample_size=1000, seed=None, chunk_size=1024):
+    """ Computes the mean silhouette score of up to sample_size points drawn
+        at random, measured against all of the data. Ranges from -1 to 1,
+        higher is better.
+    """
+    points = numpy.asarray(data, dtype=numpy.float64).T
+    labels = numpy.asarray(labels, dtype=numpy.intp)
+    n = len(points)
+    m = labels.max() + 1
+
+    sample = numpy.arange(n)
+    if sample_size is not None and sample_size < n:
+        sample = numpy.random.RandomState(seed).permutation(n)[:sample_size]
+
+    counts = numpy.bincount(labels, minlength=m).astype(numpy.float64)
+    members = numpy.zeros((n, m))
+    members[numpy.arange(n), labels] = 1.0
+
+    scores = []
+    for start in range(0, len(sample), chunk_size):
+        rows = sample[start:start + chunk_size]
+        dist = numpy.sqrt(numpy.maximum(_sq_distances(points[rows], points),
+                                        0.0))
+        # sum of the distances from each sampled point to every cluster
+        totals = numpy.dot(dist, members)
+
+        own = labels[rows]
+        own_counts = counts[own]
+        index = numpy.arange(len(rows))
+        inner = totals[index, own] / numpy.maximum(own_counts - 1, 1)
+
+        means = totals / numpy.maximum(counts, 1)
+        means[:, counts == 0] = numpy.inf
+        means[index, own] = numpy.inf
+        outer = means.min(axis=1)
+
+        score = (outer - inner) / numpy.maximum(inner, outer)
+        # a point alone in its cluster scores zero by convention
+        score[own_counts <= 1] = 0.0
+        scores.append(score)
+
+    return float(numpy.concatenate(scores).mean())
+
+
+def _sq_distances(a, b):
+    """ Returns the squared distance between every row of a and every row of
+        b.
+    """
+    dist = numpy.dot(a, b.T)
+    dist *= -2.0
+    dist += (b * b).sum(axis=1)
+    dist += (a * a).sum(axis=1)[:, numpy.newaxis]
+    return dist
+
+
+def _max_sq_distance(points, chunk_size):
+    """ Returns the largest squared distance between any two rows of points,
+        comparing chunk_size rows against the rest at a time.
+    """
+    maximum = 0.0
+    for start in range(0, len(points), chunk_size):
+        block = _sq_distances(points[start:start + chunk_size],
+                              points[start:])
+        maximum = max(maximum, block.max())
+    return maximum